@@ -1,5 +1,7 @@
 import os
 
+import pytest
+
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 root_dir_content = os.listdir(BASE_DIR)
 PROJECT_DIR_NAME = 'yatube'
@@ -37,3 +39,31 @@ pytest_plugins = [
     'tests.fixtures.fixture_user',
     'tests.fixtures.fixture_data',
 ]
+
+
+@pytest.fixture(scope='session', autouse=True)
+def isolated_cache():
+    # Как core.test_runner для manage.py test: общий кеш машины не
+    # чистится и не засоряется тестами.
+    import tempfile
+
+    from django.test.utils import override_settings
+
+    from core.test_runner import isolated_caches
+
+    with tempfile.TemporaryDirectory() as directory:
+        with override_settings(CACHES=isolated_caches(directory)):
+            yield
+
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    from django.core.cache import cache
+    cache.clear()
+
+
+@pytest.fixture(autouse=True)
+def inline_thumbnails(settings):
+    # Фоновый пул миниатюр переживает тест и пишет в уже удалённый
+    # временный MEDIA_ROOT.
+    settings.POST_THUMBNAIL_WORKERS = 0
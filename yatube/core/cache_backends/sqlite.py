@@ -0,0 +1,242 @@
+"""Кеш в файле SQLite, общий для всех процессов на машине."""
+import os
+import pickle
+import sqlite3
+import threading
+import time
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS cache (
+    key TEXT PRIMARY KEY,
+    value BLOB NOT NULL,
+    expires REAL,
+    accessed REAL NOT NULL,
+    size INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS cache_accessed ON cache (accessed);
+CREATE TABLE IF NOT EXISTS cache_stats (
+    id INTEGER PRIMARY KEY CHECK (id = 0),
+    entries INTEGER NOT NULL,
+    size INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO cache_stats VALUES (0, 0, 0);
+CREATE TRIGGER IF NOT EXISTS cache_insert AFTER INSERT ON cache BEGIN
+    UPDATE cache_stats SET entries = entries + 1, size = size + new.size;
+END;
+CREATE TRIGGER IF NOT EXISTS cache_delete AFTER DELETE ON cache BEGIN
+    UPDATE cache_stats SET entries = entries - 1, size = size - old.size;
+END;
+CREATE TRIGGER IF NOT EXISTS cache_update AFTER UPDATE OF size ON cache
+BEGIN
+    UPDATE cache_stats SET size = size - old.size + new.size;
+END;
+'''
+
+# Чтение обновляет время доступа не чаще, чем раз в столько секунд:
+# для вытеснения LRU такой точности хватает, а запись на каждый get дорога.
+TOUCH_GRANULARITY = 10
+# Старые сборки SQLite принимают не больше 999 параметров в запросе.
+CHUNK = 500
+
+
+class SQLiteCache(BaseCache):
+    """LRU-кеш с ограничением по числу записей и размеру в байтах.
+
+    Целые числа хранятся как INTEGER, поэтому incr выполняется одним
+    UPDATE внутри транзакции и атомарен между процессами.
+    """
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self._path = location
+        self._max_size = int(options.get('MAX_SIZE', 64 * 1024 * 1024))
+        self._busy_timeout = float(options.get('BUSY_TIMEOUT', 5))
+        self._local = threading.local()
+
+    @property
+    def _db(self):
+        # Соединения не переживают fork: воркеры открывают свои.
+        pid = os.getpid()
+        if getattr(self._local, 'pid', None) != pid:
+            directory = os.path.dirname(self._path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            db = sqlite3.connect(
+                self._path, timeout=self._busy_timeout,
+                isolation_level=None)
+            db.execute('PRAGMA journal_mode=WAL')
+            db.execute('PRAGMA synchronous=NORMAL')
+            db.executescript(SCHEMA)
+            self._local.db, self._local.pid = db, pid
+        return self._local.db
+
+    @staticmethod
+    def _dump(value):
+        if isinstance(value, int) and not isinstance(value, bool):
+            return value, 8
+        data = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        return data, len(data)
+
+    @staticmethod
+    def _load(value):
+        if isinstance(value, int):
+            return value
+        return pickle.loads(value)
+
+    def _key(self, key, version):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        return key
+
+    def _write(self, rows, mode='REPLACE'):
+        now = time.time()
+        db = self._db
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            written = 0
+            for key, value, expires in rows:
+                value, size = self._dump(value)
+                if mode == 'IGNORE':
+                    db.execute(
+                        'DELETE FROM cache WHERE key = ? AND expires <= ?',
+                        (key, now))
+                written += db.execute(
+                    f'INSERT OR {mode} INTO cache '
+                    'VALUES (?, ?, ?, ?, ?)',
+                    (key, value, expires, now, size)).rowcount
+            self._cull(db, now)
+            db.execute('COMMIT')
+        except BaseException:
+            db.execute('ROLLBACK')
+            raise
+        return written
+
+    def _cull(self, db, now):
+        entries, size = db.execute(
+            'SELECT entries, size FROM cache_stats').fetchone()
+        if entries <= self._max_entries and size <= self._max_size:
+            return
+        db.execute('DELETE FROM cache WHERE expires <= ?', (now,))
+        entries, size = db.execute(
+            'SELECT entries, size FROM cache_stats').fetchone()
+        if entries <= self._max_entries and size <= self._max_size:
+            return
+        if self._cull_frequency == 0:
+            db.execute('DELETE FROM cache')
+            return
+        db.execute(
+            'DELETE FROM cache WHERE key IN ('
+            'SELECT key FROM cache ORDER BY accessed LIMIT ?)',
+            (max(1, entries // self._cull_frequency),))
+
+    def _read(self, keys):
+        now = time.time()
+        found = {}
+        stale = []
+        for start in range(0, len(keys), CHUNK):
+            chunk = keys[start:start + CHUNK]
+            rows = self._db.execute(
+                'SELECT key, value, accessed FROM cache '
+                f'WHERE key IN ({", ".join("?" * len(chunk))}) '
+                'AND (expires IS NULL OR expires > ?)',
+                (*chunk, now)).fetchall()
+            for key, value, accessed in rows:
+                found[key] = self._load(value)
+                if now - accessed > TOUCH_GRANULARITY:
+                    stale.append(key)
+        if stale:
+            self._touch(stale, now)
+        return found
+
+    def _touch(self, keys, now):
+        try:
+            for start in range(0, len(keys), CHUNK):
+                chunk = keys[start:start + CHUNK]
+                self._db.execute(
+                    'UPDATE cache SET accessed = ? '
+                    f'WHERE key IN ({", ".join("?" * len(chunk))})',
+                    (now, *chunk))
+        except sqlite3.OperationalError:
+            # Занятая база не повод ронять чтение: отметка доступа
+            # нужна только для порядка вытеснения.
+            pass
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self._key(key, version)
+        expires = self.get_backend_timeout(timeout)
+        return self._write([(key, value, expires)], mode='IGNORE') > 0
+
+    def get(self, key, default=None, version=None):
+        key = self._key(key, version)
+        return self._read([key]).get(key, default)
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self._key(key, version)
+        self._write([(key, value, self.get_backend_timeout(timeout))])
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self._key(key, version)
+        return self._db.execute(
+            'UPDATE cache SET expires = ?, accessed = ? WHERE key = ? '
+            'AND (expires IS NULL OR expires > ?)',
+            (self.get_backend_timeout(timeout), time.time(), key,
+             time.time())).rowcount > 0
+
+    def delete(self, key, version=None):
+        key = self._key(key, version)
+        self._db.execute('DELETE FROM cache WHERE key = ?', (key,))
+
+    def get_many(self, keys, version=None):
+        if not keys:
+            return {}
+        names = {self._key(key, version): key for key in keys}
+        found = self._read(list(names))
+        return {names[key]: value for key, value in found.items()}
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        expires = self.get_backend_timeout(timeout)
+        self._write([(self._key(key, version), value, expires)
+                     for key, value in data.items()])
+        return []
+
+    def delete_many(self, keys, version=None):
+        keys = [self._key(key, version) for key in keys]
+        for start in range(0, len(keys), CHUNK):
+            chunk = keys[start:start + CHUNK]
+            self._db.execute(
+                'DELETE FROM cache '
+                f'WHERE key IN ({", ".join("?" * len(chunk))})', chunk)
+
+    def incr(self, key, delta=1, version=None):
+        key = self._key(key, version)
+        db = self._db
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            row = db.execute(
+                'SELECT value FROM cache WHERE key = ? '
+                'AND (expires IS NULL OR expires > ?)',
+                (key, time.time())).fetchone()
+            if row is None:
+                raise ValueError(f"Key '{key}' not found")
+            value = self._load(row[0]) + delta
+            stored, size = self._dump(value)
+            db.execute('UPDATE cache SET value = ?, size = ? WHERE key = ?',
+                       (stored, size, key))
+            db.execute('COMMIT')
+        except BaseException:
+            db.execute('ROLLBACK')
+            raise
+        return value
+
+    def has_key(self, key, version=None):
+        key = self._key(key, version)
+        return self._db.execute(
+            'SELECT 1 FROM cache WHERE key = ? '
+            'AND (expires IS NULL OR expires > ?)',
+            (key, time.time())).fetchone() is not None
+
+    def clear(self):
+        self._db.execute('DELETE FROM cache')
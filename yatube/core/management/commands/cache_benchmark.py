@@ -0,0 +1,65 @@
+import os
+import shutil
+import tempfile
+import time
+
+from django.core.cache.backends.filebased import FileBasedCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.management.base import BaseCommand
+
+from core.cache_backends.sqlite import SQLiteCache
+
+PAYLOAD = 'x' * 2048
+
+
+class Command(BaseCommand):
+    help = 'Сравнивает скорость SQLiteCache с LocMemCache и FileBasedCache.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--operations', type=int, default=2000)
+        parser.add_argument('--batch', type=int, default=10,
+                            help='Ключей в одном get_many/set_many.')
+
+    def backends(self, directory):
+        params = {'OPTIONS': {'MAX_ENTRIES': 10 ** 6}}
+        return (
+            ('LocMemCache', LocMemCache('benchmark', params)),
+            ('FileBasedCache',
+             FileBasedCache(os.path.join(directory, 'files'), params)),
+            ('SQLiteCache',
+             SQLiteCache(os.path.join(directory, 'cache.sqlite3'), params)),
+        )
+
+    def scenarios(self, cache, operations, batch):
+        keys = [f'key-{number}' for number in range(operations)]
+        groups = [keys[start:start + batch]
+                  for start in range(0, operations, batch)]
+        cache.set('counter', 0, None)
+        return (
+            ('set', operations,
+             lambda: [cache.set(key, PAYLOAD) for key in keys]),
+            ('get', operations,
+             lambda: [cache.get(key) for key in keys]),
+            ('set_many', operations, lambda: [
+                cache.set_many(dict.fromkeys(group, PAYLOAD))
+                for group in groups]),
+            ('get_many', operations,
+             lambda: [cache.get_many(group) for group in groups]),
+            ('incr', operations,
+             lambda: [cache.incr('counter') for _ in keys]),
+        )
+
+    def handle(self, *args, **options):
+        directory = tempfile.mkdtemp()
+        try:
+            for name, cache in self.backends(directory):
+                for operation, count, run in self.scenarios(
+                        cache, options['operations'], options['batch']):
+                    started = time.perf_counter()
+                    run()
+                    elapsed = time.perf_counter() - started
+                    self.stdout.write(
+                        f'{name:<15} {operation:<9} '
+                        f'{count / elapsed:>12,.0f} ключей/с')
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
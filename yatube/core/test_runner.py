@@ -0,0 +1,37 @@
+"""Запуск тестов с собственным кешем вместо общего кеша машины."""
+import os
+import shutil
+import tempfile
+
+from django.conf import settings
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+
+def isolated_caches(directory):
+    """CACHES с теми же бэкендами, но с файлами внутри directory."""
+    return {
+        alias: dict(options,
+                    LOCATION=os.path.join(directory, f'{alias}.sqlite3'))
+        for alias, options in settings.CACHES.items()
+    }
+
+
+class IsolatedCacheRunner(DiscoverRunner):
+    """Раннер, подменяющий кеш на временный на время прогона.
+
+    Тесты чистят кеш перед каждым тестом, а общий кеш сайта на той же
+    машине они трогать не должны.
+    """
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self.cache_directory = tempfile.mkdtemp()
+        self.cache_settings = override_settings(
+            CACHES=isolated_caches(self.cache_directory))
+        self.cache_settings.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self.cache_settings.disable()
+        shutil.rmtree(self.cache_directory, ignore_errors=True)
+        super().teardown_test_environment(**kwargs)
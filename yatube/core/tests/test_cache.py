@@ -0,0 +1,61 @@
+import os
+import shutil
+import tempfile
+
+from django.conf import settings
+from django.core.cache import caches
+from django.test import SimpleTestCase
+
+from core.cache_backends.sqlite import SQLiteCache
+
+
+class SQLiteCacheTest(SimpleTestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'cache.sqlite3')
+        self.cache = SQLiteCache(self.path, {'OPTIONS': {'MAX_ENTRIES': 10}})
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def test_values_are_shared_between_instances(self):
+        """Значения видны другому экземпляру кеша на том же файле."""
+        self.cache.set_many({'a': 1, 'b': {'text': 'пост'}})
+        other = SQLiteCache(self.path, {})
+        self.assertEqual(other.get_many(['a', 'b', 'c']),
+                         {'a': 1, 'b': {'text': 'пост'}})
+        self.assertEqual(other.incr('a', 4), 5)
+        self.assertEqual(self.cache.get('a'), 5)
+
+    def test_incr_missing_and_expired(self):
+        """incr отсутствующего или просроченного ключа — ValueError."""
+        self.cache.set('expired', 1, timeout=0)
+        for key in ('missing', 'expired'):
+            with self.subTest(key=key):
+                with self.assertRaises(ValueError):
+                    self.cache.incr(key)
+        self.assertTrue(self.cache.add('expired', 2))
+        self.assertFalse(self.cache.add('expired', 3))
+
+    def test_lru_eviction(self):
+        """При переполнении вытесняются давно не читанные ключи."""
+        self.cache.set('hot', 'value')
+        self.cache._db.execute(
+            "UPDATE cache SET accessed = accessed + 100 WHERE key LIKE '%hot'")
+        for number in range(20):
+            self.cache.set(f'cold-{number}', 'value')
+        entries = self.cache._db.execute(
+            'SELECT count(*) FROM cache').fetchone()[0]
+        self.assertLessEqual(entries, 11)
+        self.assertEqual(self.cache.get('hot'), 'value')
+
+
+class IsolatedCacheTest(SimpleTestCase):
+
+    def test_tests_do_not_share_site_cache(self):
+        """Тесты работают не с общим файлом кеша сайта."""
+        site_cache = os.path.join(settings.BASE_DIR, 'cache.sqlite3')
+        self.assertNotEqual(settings.CACHES['default']['LOCATION'],
+                            site_cache)
+        self.assertNotEqual(caches['default']._path, site_cache)
@@ -1,6 +1,11 @@
 from django.contrib import admin
+from django.db.models import Count
+from django.urls import reverse
+from django.utils.html import format_html
 
-from .models import Comment, Dislikes, Follow, Group,Likes, Post
+from . import search
+from .models import (Comment, Dislikes, DuplicateCluster, Follow, Group,
+                     Likes, Post)
 
 
 @admin.register(Post)
@@ -9,8 +14,15 @@ class PostAdmin(admin.ModelAdmin):
     list_editable = ('group',)
     search_fields = ('text',)
     list_filter = ('pub_date',)
+    raw_id_fields = ('duplicate_of',)
     empty_value_display = '-пусто-'
 
+    def get_search_results(self, request, queryset, search_term):
+        if not search_term.strip() or not search.enabled():
+            return super().get_search_results(
+                request, queryset, search_term)
+        return search.filter_matching(queryset, search_term), False
+
 
 @admin.register(Group)
 class GroupAdmin(admin.ModelAdmin):
@@ -42,3 +54,26 @@ class PostAdmin(admin.ModelAdmin):
 @admin.register(Dislikes)
 class PostAdmin(admin.ModelAdmin):
     list_display = ('user', 'post')
+
+
+@admin.register(DuplicateCluster)
+class DuplicateClusterAdmin(admin.ModelAdmin):
+    """Посты, на картинки которых похожи картинки других постов."""
+
+    list_display = ('pk', 'text', 'author', 'pub_date', 'copies')
+    empty_value_display = '-пусто-'
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).filter(
+            duplicates__isnull=False).annotate(
+            copies_count=Count('duplicates')).select_related('author')
+
+    def copies(self, obj):
+        url = reverse('admin:posts_post_changelist')
+        return format_html('<a href="{}?duplicate_of__id__exact={}">{}</a>',
+                           url, obj.pk, obj.copies_count)
+    copies.short_description = 'Копий'
+    copies.admin_order_field = 'copies_count'
+
+    def has_add_permission(self, request):
+        return False
@@ -0,0 +1,163 @@
+import hashlib
+import json
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import Http404, HttpResponse, JsonResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.views.decorators.http import require_safe
+
+from . import caching
+from .models import Group, Post, User
+from .utils import FEED_KEYS, CursorPaginator
+
+# Поле ответа -> колонка для values().
+COLUMNS = {
+    'id': 'id',
+    'text': 'text',
+    'pub_date': 'pub_date',
+    'author': 'author__username',
+    'group': 'group__slug',
+    'image': 'image',
+    'image_width': 'image_width',
+    'image_height': 'image_height',
+    'likes_count': 'likes_count',
+    'dislikes_count': 'dislikes_count',
+    'comments_count': 'comments_count',
+}
+
+
+class RowPaginator(CursorPaginator):
+    """Курсорная пагинация по словарям из values() вместо моделей."""
+
+    def cursor_values(self, obj):
+        return [obj[key] for key in self.keys]
+
+
+def _fields(request):
+    raw = request.GET.get('fields')
+    if not raw:
+        return tuple(COLUMNS)
+    fields = tuple(dict.fromkeys(
+        field.strip() for field in raw.split(',') if field.strip()))
+    unknown = [field for field in fields if field not in COLUMNS]
+    if unknown or not fields:
+        return None
+    return fields
+
+
+def _serialize(row, fields):
+    data = {field: row[COLUMNS[field]] for field in fields}
+    if data.get('image'):
+        data['image'] = Post._meta.get_field('image').storage.url(
+            data['image'])
+    elif 'image' in data:
+        data['image'] = None
+    return data
+
+
+def _columns(fields):
+    # Ключи курсора нужны всегда, даже если их не просили.
+    return list(dict.fromkeys(
+        [COLUMNS[field] for field in fields] + list(FEED_KEYS)))
+
+
+def _link(request, name, cursor):
+    if cursor is None:
+        return None
+    params = request.GET.copy()
+    params.pop('after', None)
+    params.pop('before', None)
+    params[name] = cursor
+    return f'{request.path}?{params.urlencode()}'
+
+
+def _respond(request, version, build):
+    """Отвечает JSON с ETag из поколений областей или 304.
+
+    Тело зависит только от поколений и адреса запроса, поэтому ETag
+    строгий и считается до похода в базу, а готовое тело кешируется
+    под ним же.
+    """
+    fields = _fields(request)
+    if fields is None:
+        return JsonResponse(
+            {'error': f'Доступные поля: {", ".join(COLUMNS)}'}, status=400)
+    etag = '"{}"'.format(hashlib.md5(
+        f'{version}|{request.get_full_path()}'.encode()).hexdigest())
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        key = f'api:{etag}'
+        body = cache.get(key)
+        if body is None:
+            body = json.dumps(
+                build(fields), cls=DjangoJSONEncoder, ensure_ascii=False,
+                separators=(',', ':')).encode()
+            cache.set(key, body, settings.FEED_CACHE_TIMEOUT)
+        response = HttpResponse(body, content_type='application/json')
+    response['ETag'] = etag
+    # Клиент может хранить ответ, но каждый раз сверяет ETag.
+    patch_cache_control(response, public=True, no_cache=True)
+    return response
+
+
+def _feed(request, posts, version):
+    def build(fields):
+        paginator = RowPaginator(
+            posts.values(*_columns(fields)),
+            settings.NUMBER_POSTS_ON_FIRST_PAGE)
+        page_obj = paginator.cursor_page(
+            after=request.GET.get('after'),
+            before=request.GET.get('before'),
+        )
+        return {
+            'results': [_serialize(row, fields) for row in page_obj],
+            'next': _link(request, 'after', paginator.next_cursor),
+            'previous': _link(request, 'before', paginator.previous_cursor),
+        }
+    return _respond(request, version, build)
+
+
+@require_safe
+def index(request):
+    version = caching.generation(caching.INDEX)
+    return _feed(request, Post.objects.all(), version)
+
+
+@require_safe
+def group_posts(request, slug_name):
+    group_id = Group.objects.filter(slug=slug_name).values_list(
+        'pk', flat=True).first()
+    if group_id is None:
+        raise Http404
+    version = caching.generation(caching.group_scope(group_id))
+    return _feed(request, Post.objects.filter(group_id=group_id), version)
+
+
+@require_safe
+def profile(request, username):
+    author_id = User.objects.filter(username=username).values_list(
+        'pk', flat=True).first()
+    if author_id is None:
+        raise Http404
+    version = caching.generation(caching.author_scope(author_id))
+    return _feed(request, Post.objects.filter(author_id=author_id), version)
+
+
+@require_safe
+def post_detail(request, post_id):
+    author_id = Post.objects.filter(pk=post_id).values_list(
+        'author_id', flat=True).first()
+    if author_id is None:
+        raise Http404
+    version = caching.generation(
+        caching.post_scope(post_id), caching.author_scope(author_id))
+
+    def build(fields):
+        row = Post.objects.filter(pk=post_id).values(
+            *_columns(fields)).first()
+        if row is None:
+            raise Http404
+        return _serialize(row, fields)
+    return _respond(request, version, build)
@@ -0,0 +1,229 @@
+import logging
+import os
+import tempfile
+import time
+import zipfile
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
+
+from . import background, caching
+from .models import Comment, Dislikes, Follow, Likes, Post
+
+logger = logging.getLogger(__name__)
+
+# Файл архива -> (модель, поле пользователя, колонки).
+MANIFESTS = {
+    'posts.jsonl': (Post, 'author', (
+        'id', 'pub_date', 'text', 'group__slug', 'image',
+        'likes_count', 'dislikes_count', 'comments_count',
+    )),
+    'comments.jsonl': (Comment, 'author', (
+        'id', 'created', 'post_id', 'text',
+    )),
+    'likes.jsonl': (Likes, 'user', ('post_id',)),
+    'dislikes.jsonl': (Dislikes, 'user', ('post_id',)),
+    'follows.jsonl': (Follow, 'user', ('author__username',)),
+}
+
+# Модель -> поле с id владельца строки.
+OWNERS = {model: f'{field}_id' for model, field, _ in MANIFESTS.values()}
+
+_pool = background.Pool('ARCHIVE_WORKERS', 'archives')
+
+
+class _Pipe:
+    # Поток без seek: zipfile пишет в него с дескрипторами данных после
+    # каждого файла, а генератор забирает накопленное.
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def filename(user):
+    return f'yatube-{user.username}.zip'
+
+
+def _entry(name, compress_type):
+    info = zipfile.ZipInfo(name, timezone.now().timetuple()[:6])
+    info.compress_type = compress_type
+    return info
+
+
+def _manifest(archive, pipe, name, user):
+    model, field, columns = MANIFESTS[name]
+    records = model.objects.filter(**{field: user}).order_by(
+        'pk').values_list(*columns).iterator(
+        chunk_size=settings.EXPORT_CHUNK_SIZE)
+    encoder = DjangoJSONEncoder(ensure_ascii=False)
+    info = _entry(name, zipfile.ZIP_DEFLATED)
+    with archive.open(info, 'w', force_zip64=True) as entry:
+        for record in records:
+            entry.write(
+                (encoder.encode(dict(zip(columns, record))) + '\n').encode())
+            yield pipe.drain()
+
+
+def _image_names(user):
+    return Post.objects.filter(author=user).exclude(image='').order_by(
+        'image').values_list('image', flat=True).distinct()
+
+
+def _images(archive, pipe, user):
+    storage = Post._meta.get_field('image').storage
+    for name in _image_names(user).iterator():
+        try:
+            source = storage.open(name)
+        except (OSError, SuspiciousFileOperation):
+            logger.warning('В архив не попала картинка %s', name)
+            continue
+        # JPEG уже сжат, deflate только потратит процессор.
+        with source, archive.open(_entry(name, zipfile.ZIP_STORED),
+                                  'w') as entry:
+            for chunk in source.chunks():
+                entry.write(chunk)
+                yield pipe.drain()
+
+
+def _zip(user):
+    pipe = _Pipe()
+    with zipfile.ZipFile(pipe, 'w') as archive:
+        for name in MANIFESTS:
+            yield from _manifest(archive, pipe, name, user)
+        yield from _images(archive, pipe, user)
+    yield pipe.drain()
+
+
+def stream(user):
+    """Zip-архив данных пользователя кусками байтов.
+
+    Внутри — манифесты JSONL по каждой таблице и оригиналы картинок под
+    теми же путями, что в поле image постов. Ни архив, ни таблицы
+    целиком в памяти не держатся.
+    """
+    return (chunk for chunk in _zip(user) if chunk)
+
+
+def is_large(user):
+    """Слишком ли велик архив, чтобы собирать его в запросе.
+
+    Считаются и строки, и байты картинок; размеры файлов читаются,
+    только пока сумма не превысила ARCHIVE_INLINE_MAX_BYTES.
+    """
+    if (Post.objects.filter(author=user).count()
+            + Comment.objects.filter(author=user).count()
+            > settings.ARCHIVE_INLINE_MAX_ITEMS):
+        return True
+    storage = Post._meta.get_field('image').storage
+    total = 0
+    for name in _image_names(user).iterator():
+        try:
+            total += storage.size(name)
+        except (OSError, SuspiciousFileOperation):
+            continue
+        if total > settings.ARCHIVE_INLINE_MAX_BYTES:
+            return True
+    return False
+
+
+def _version(user_id):
+    # Сигналы сбрасывают поколение при каждом изменении данных
+    # пользователя, так что архив старого поколения уже не отдаётся.
+    return caching.generation(
+        caching.archive_scope(user_id)).rpartition('=')[2]
+
+
+def path(user_id, version):
+    return os.path.join(settings.ARCHIVE_ROOT, f'{user_id}-{version}.zip')
+
+
+def _expired(entry, max_age):
+    return time.time() - entry.stat().st_mtime >= max_age
+
+
+def ready(user_id):
+    """Путь к собранному и актуальному архиву или None."""
+    name = path(user_id, _version(user_id))
+    try:
+        age = time.time() - os.path.getmtime(name)
+    except OSError:
+        return None
+    return name if age < settings.ARCHIVE_MAX_AGE else None
+
+
+def purge():
+    """Удаляет просроченные, устаревшие и брошенные архивы."""
+    try:
+        entries = list(os.scandir(settings.ARCHIVE_ROOT))
+    except FileNotFoundError:
+        return
+    for entry in entries:
+        stem, extension = os.path.splitext(entry.name)
+        user_id, _, version = stem.partition('-')
+        if extension == '.part':
+            stale = _expired(entry, settings.ARCHIVE_BUILD_TIMEOUT)
+        elif extension == '.zip' and user_id.isdigit():
+            stale = (version != _version(int(user_id))
+                     or _expired(entry, settings.ARCHIVE_MAX_AGE))
+        else:
+            continue
+        if stale:
+            try:
+                os.remove(entry.path)
+            except FileNotFoundError:
+                pass
+
+
+def build(user):
+    """Собирает архив в файл рядом с готовым и атомарно подменяет его.
+
+    Архив подписан поколением, прочитанным до сборки: если данные
+    изменятся по ходу, он просто не будет отдан.
+    """
+    version = _version(user.pk)
+    os.makedirs(settings.ARCHIVE_ROOT, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(
+        dir=settings.ARCHIVE_ROOT, suffix='.part')
+    try:
+        with os.fdopen(fd, 'wb') as temp:
+            for chunk in stream(user):
+                temp.write(chunk)
+        os.replace(temp_path, path(user.pk, version))
+    except BaseException:
+        os.remove(temp_path)
+        raise
+    purge()
+
+
+def _lock_key(user_id):
+    return f'archive-building:{user_id}:{_version(user_id)}'
+
+
+def _run(user, lock):
+    try:
+        build(user)
+    except Exception:
+        logger.exception('Не удалось собрать архив пользователя %s', user.pk)
+    finally:
+        cache.delete(lock)
+
+
+def enqueue(user):
+    """Ставит сборку архива в фон, если она ещё не идёт."""
+    lock = _lock_key(user.pk)
+    if cache.add(lock, True, settings.ARCHIVE_BUILD_TIMEOUT):
+        _pool.submit(_run, user, lock)
@@ -0,0 +1,39 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections
+
+
+def _work(func, args):
+    # У потока пула собственное соединение с базой.
+    close_old_connections()
+    try:
+        func(*args)
+    finally:
+        close_old_connections()
+
+
+class Pool:
+    """Фоновый пул потоков, который создаётся при первой задаче.
+
+    Размер пула берётся из настройки workers_setting при каждом вызове;
+    0 — задача выполняется сразу в текущем потоке.
+    """
+
+    def __init__(self, workers_setting, name):
+        self.workers_setting = workers_setting
+        self.name = name
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def submit(self, func, *args):
+        workers = getattr(settings, self.workers_setting)
+        if not workers:
+            func(*args)
+            return
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=workers, thread_name_prefix=self.name)
+        self._executor.submit(_work, func, args)
@@ -0,0 +1,185 @@
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+
+from .models import Post
+
+INDEX = 'index'
+
+
+def group_scope(group_id):
+    return f'group:{group_id}'
+
+
+def author_scope(author_id):
+    return f'author:{author_id}'
+
+
+def follow_scope(user_id):
+    return f'follow:{user_id}'
+
+
+def post_scope(post_id):
+    return f'post:{post_id}'
+
+
+def archive_scope(user_id):
+    return f'archive:{user_id}'
+
+
+def _key(scope):
+    return f'generation:{scope}'
+
+
+def _modified_key(scope):
+    return f'modified:{scope}'
+
+
+def _initial():
+    # Счётчик, вытесненный из кеша, не должен вернуться к уже
+    # использованному значению, поэтому он начинается с текущего времени.
+    return int(time.time() * 1000)
+
+
+def _read(keys, initial):
+    values = cache.get_many(keys)
+    for key in keys:
+        if key not in values:
+            cache.add(key, initial(), None)
+            values[key] = cache.get(key)
+    return values
+
+
+def generation(*scopes):
+    keys = [_key(scope) for scope in scopes]
+    values = _read(keys, _initial)
+    return '|'.join(f'{scope}={values[key]}' for scope, key in zip(
+        scopes, keys))
+
+
+def last_modified(*scopes):
+    """Время последнего сброса областей, unix-время в секундах.
+
+    Если отметка вытеснена из кеша, область считается изменённой
+    сейчас: лишний полный ответ лучше ложного 304.
+    """
+    values = _read([_modified_key(scope) for scope in scopes], time.time)
+    return max(values.values())
+
+
+def _bump(scopes):
+    for scope in scopes:
+        key = _key(scope)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.add(key, _initial(), None)
+    now = time.time()
+    cache.set_many({_modified_key(scope): now for scope in scopes}, None)
+
+
+def bump(*scopes):
+    """Сбрасывает кеш областей сейчас и ещё раз после коммита.
+
+    Повторный сброс закрывает окно, в котором параллельный запрос мог
+    закешировать данные до коммита под новым поколением.
+    """
+    _bump(scopes)
+    transaction.on_commit(lambda: _bump(scopes))
+
+
+def post_scopes(post_id, author_id, group_id):
+    scopes = [INDEX, post_scope(post_id), author_scope(author_id)]
+    if group_id is not None:
+        scopes.append(group_scope(group_id))
+    return scopes
+
+
+def bump_post(post_id):
+    post = Post.objects.filter(pk=post_id).values(
+        'author_id', 'group_id').first()
+    if post is not None:
+        bump(*post_scopes(post_id, post['author_id'], post['group_id']))
+
+
+def scopes_of(version):
+    return [part.rpartition('=')[0] for part in version.split('|') if part]
+
+
+def validators(request, version):
+    """ETag и Last-Modified страницы без её отрисовки.
+
+    Страница зависит от поколений областей, адреса и того, кто её
+    смотрит: кнопки подписки и реакций у каждого свои. У вошедших в
+    страницу попадает и CSRF-токен, а login() меняет его секрет, так
+    что секрет тоже входит в ETag. Читатель входит только в ETag,
+    поэтому Last-Modified (None) у вошедших не ставится: иначе после
+    входа или выхода If-Modified-Since вернул бы 304 со страницей
+    другого читателя.
+    """
+    viewer = ''
+    if request.user.is_authenticated:
+        viewer = f'{request.user.pk}:{request.META.get("CSRF_COOKIE", "")}'
+    etag = '"{}"'.format(hashlib.md5(
+        f'{version}|{viewer}|{request.get_full_path()}'.encode()).hexdigest())
+    if viewer:
+        return etag, None
+    modified = int(last_modified(*scopes_of(version)))
+    # Last-Modified точен до секунды: пока секунда последнего сброса не
+    # кончилась, в ней возможен ещё сброс с тем же значением, и
+    # If-Modified-Since дал бы 304 на устаревшую страницу.
+    if modified >= int(time.time()):
+        return etag, None
+    return etag, modified
+
+
+def _set_validators(response, etag, modified):
+    response['ETag'] = etag
+    if modified is not None:
+        response['Last-Modified'] = http_date(modified)
+    return response
+
+
+def not_modified(request, version):
+    """Ответ 304, если у клиента актуальная страница, иначе None.
+
+    Проверяется до запросов ленты и отрисовки шаблона.
+    """
+    etag, modified = validators(request, version)
+    response = get_conditional_response(
+        request, etag=etag, last_modified=modified)
+    if response is not None:
+        _set_validators(response, etag, modified)
+    return response
+
+
+def tag_response(response, version, posts=(), request=None):
+    """Помечает ответ поколениями областей для кеша целых страниц.
+
+    Surrogate-Key дублирует метки для внешнего прокси и дополнительно
+    перечисляет посты на странице. С request ответ получает ещё ETag и
+    Last-Modified для условных запросов, см. not_modified().
+    """
+    response.surrogate_version = version
+    keys = scopes_of(version) + [post_scope(post.pk) for post in posts]
+    response['Surrogate-Key'] = ' '.join(keys)
+    if request is not None:
+        _set_validators(response, *validators(request, version))
+    return response
+
+
+def feed_cache(request, page_obj, version):
+    """Ключ и время жизни кеша ленты для тега {% cache %}.
+
+    Поколения областей (version) читаются до запроса ленты, иначе
+    старые данные могли бы попасть в кеш под новым поколением. Фрагмент
+    общий для всех читателей: персональные части карточек дорисовывает
+    {% fillholes %} после чтения кеша.
+    """
+    key = [version, page_obj.paginator.cursor]
+    return {'key': ':'.join(key), 'timeout': settings.FEED_CACHE_TIMEOUT}
@@ -0,0 +1,72 @@
+from functools import reduce
+from operator import or_
+
+from django.conf import settings
+from django.db.models import Q
+
+from .models import ImageHashBand, Post
+
+BANDS = 4
+BAND_BITS = 64 // BANDS
+MASK = (1 << 64) - 1
+
+
+def bands(image_hash):
+    unsigned = image_hash & MASK
+    return [(unsigned >> (band * BAND_BITS)) & ((1 << BAND_BITS) - 1)
+            for band in range(BANDS)]
+
+
+def distance(first, second):
+    return bin((first ^ second) & MASK).count('1')
+
+
+def similar(image_hash, exclude=None):
+    """Посты с похожей картинкой, от самых похожих.
+
+    Находит все хеши на расстоянии Хэмминга не больше
+    POST_IMAGE_DUPLICATE_DISTANCE: для этого оно не должно превышать
+    BANDS - 1.
+    """
+    condition = reduce(or_, (
+        Q(band=band, value=value)
+        for band, value in enumerate(bands(image_hash))))
+    candidates = ImageHashBand.objects.filter(condition)
+    if exclude is not None:
+        candidates = candidates.exclude(post_id=exclude)
+    found = {}
+    for post_id, other in candidates.values_list(
+            'post_id', 'post__image_hash'):
+        if other is not None:
+            found[post_id] = distance(image_hash, other)
+    limit = settings.POST_IMAGE_DUPLICATE_DISTANCE
+    return sorted((dist, post_id) for post_id, dist in found.items()
+                  if dist <= limit)
+
+
+def flag(post):
+    """Отмечает пост копией самого раннего поста с похожей картинкой."""
+    post.duplicate_of = None
+    if post.image_hash is None:
+        return
+    matches = similar(post.image_hash, exclude=post.pk)
+    if not matches:
+        return
+    originals = Post.objects.filter(
+        pk__in=[post_id for _, post_id in matches]).values_list(
+        'pk', 'duplicate_of_id')
+    # Копия копии относится к тому же кластеру, что и оригинал.
+    post.duplicate_of_id = min(
+        original or pk for pk, original in originals)
+
+
+def index_new_posts(posts):
+    ImageHashBand.objects.bulk_create(
+        ImageHashBand(post_id=post.pk, band=band, value=value)
+        for post in posts if post.image_hash is not None
+        for band, value in enumerate(bands(post.image_hash)))
+
+
+def index_post(post):
+    ImageHashBand.objects.filter(post=post).delete()
+    index_new_posts([post])
@@ -0,0 +1,92 @@
+import csv
+import zlib
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import Comment, Post
+
+# Таблица -> (модель, поле даты, выгружаемые колонки).
+TABLES = {
+    'posts': (Post, 'pub_date', (
+        'id', 'pub_date', 'author__username', 'group__slug', 'text',
+        'image', 'likes_count', 'dislikes_count', 'comments_count',
+    )),
+    'comments': (Comment, 'created', (
+        'id', 'created', 'post_id', 'author__username', 'text',
+    )),
+}
+FORMATS = {
+    'jsonl': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+
+
+class _Echo:
+    # csv.writer пишет строку в «файл» и возвращает то, что тот вернул.
+    def write(self, value):
+        return value
+
+
+def parse_since(value):
+    """Дата водяного знака из ISO 8601; без пояса — в текущем поясе."""
+    since = parse_datetime(value)
+    if since is None:
+        raise ValueError(f'Непонятная дата {value!r}')
+    if timezone.is_naive(since):
+        since = timezone.make_aware(since)
+    return since
+
+
+def rows(table, since=None, since_id=None):
+    """Строки таблицы по возрастанию id, начиная с водяного знака.
+
+    since отбирает записи не раньше этой даты, since_id — с id больше
+    этого. Записи читаются кусками по EXPORT_CHUNK_SIZE, так что память
+    не зависит от размера таблицы.
+    """
+    model, date_field, columns = TABLES[table]
+    queryset = model.objects.order_by('pk')
+    if since is not None:
+        queryset = queryset.filter(**{f'{date_field}__gte': since})
+    if since_id is not None:
+        queryset = queryset.filter(pk__gt=since_id)
+    return queryset.values_list(*columns).iterator(
+        chunk_size=settings.EXPORT_CHUNK_SIZE)
+
+
+def serialize(table, records, file_format):
+    """Текстовые строки выгрузки, по одной на запись."""
+    columns = TABLES[table][2]
+    if file_format == 'csv':
+        writer = csv.writer(_Echo())
+        yield writer.writerow(columns)
+        for record in records:
+            yield writer.writerow(record)
+        return
+    encoder = DjangoJSONEncoder(ensure_ascii=False)
+    for record in records:
+        yield encoder.encode(dict(zip(columns, record))) + '\n'
+
+
+def encode(lines, compress=False):
+    """Кодирует строки в байты, при compress — сразу в gzip."""
+    if not compress:
+        for line in lines:
+            yield line.encode()
+        return
+    # wbits=31 — заголовок и контрольная сумма gzip вокруг deflate.
+    compressor = zlib.compressobj(wbits=31)
+    for line in lines:
+        chunk = compressor.compress(line.encode())
+        if chunk:
+            yield chunk
+    yield compressor.flush()
+
+
+def export(table, file_format, since=None, since_id=None, compress=False):
+    return encode(
+        serialize(table, rows(table, since, since_id), file_format),
+        compress)
@@ -1,5 +1,8 @@
+from django.core.files.uploadedfile import UploadedFile
 from django.forms import ModelForm
 
+from . import duplicates
+from .images import ingest
 from .models import Comment, Group, Post
 
 
@@ -10,6 +13,19 @@ class PostForm(ModelForm):
         fields = ('text', 'group', 'image')
         labels = {'text': 'текст', 'group': 'группа', 'image': 'картинка'}
 
+    def clean_image(self):
+        image = self.cleaned_data.get('image')
+        if isinstance(image, UploadedFile):
+            image = ingest(image)
+            self.instance.image_width = image.width
+            self.instance.image_height = image.height
+            self.instance.image_hash = image.perceptual_hash
+            duplicates.flag(self.instance)
+        elif not image:
+            self.instance.image_width = self.instance.image_height = None
+            self.instance.image_hash = self.instance.duplicate_of = None
+        return image
+
 
 class CommentForm(ModelForm):
 
@@ -0,0 +1,133 @@
+import logging
+import os
+import tempfile
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation, ValidationError
+from django.core.files.images import ImageFile as DjangoImageFile
+from django.db import transaction
+from PIL import Image, ImageOps
+from sorl.thumbnail import default
+from sorl.thumbnail.images import ImageFile
+
+from .models import Post
+
+logger = logging.getLogger(__name__)
+
+ACCEPTED_FORMATS = ('JPEG', 'PNG', 'GIF', 'WEBP', 'BMP')
+HASH_SIDE = 8
+
+
+def _open(upload):
+    # Image.open читает только заголовок, пиксели не декодируются.
+    upload.seek(0)
+    try:
+        image = Image.open(upload)
+    except Image.DecompressionBombError:
+        raise ValidationError('Слишком большая картинка.')
+    except (OSError, SyntaxError, ValueError):
+        raise ValidationError('Файл не похож на картинку.')
+    if image.format not in ACCEPTED_FORMATS:
+        raise ValidationError(
+            f'Формат {image.format} не поддерживается.')
+    width, height = image.size
+    if width * height > settings.POST_IMAGE_MAX_PIXELS:
+        raise ValidationError('Слишком большая картинка.')
+    return image
+
+
+def dhash(image):
+    """Перцептивный хеш картинки (dHash) в виде 64-битного числа.
+
+    Картинка сжимается до 9x8 в оттенках серого, каждый бит — «левый
+    пиксель ярче правого». Пережатие и небольшая обрезка меняют лишь
+    несколько битов.
+    """
+    small = image.convert('L').resize(
+        (HASH_SIDE + 1, HASH_SIDE), Image.LANCZOS)
+    pixels = list(small.getdata())
+    value = 0
+    for row in range(HASH_SIDE):
+        for column in range(HASH_SIDE):
+            left = pixels[row * (HASH_SIDE + 1) + column]
+            value = value << 1 | (left > pixels[
+                row * (HASH_SIDE + 1) + column + 1])
+    # BigIntegerField знаковое.
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+
+def _flatten(image):
+    if image.mode in ('RGBA', 'LA', 'P'):
+        image = image.convert('RGBA')
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        background.paste(image, mask=image.getchannel('A'))
+        return background
+    return image.convert('RGB')
+
+
+def ingest(upload):
+    """Приводит загруженную картинку к виду, в котором она хранится.
+
+    Сторона ограничивается POST_IMAGE_MAX_SIDE, EXIF отбрасывается
+    (поворот из него применяется заранее), результат — прогрессивный JPEG
+    во временном файле, а не в памяти; его width и height уже заполнены,
+    а в perceptual_hash лежит dhash().
+    """
+    image = _open(upload)
+    side = settings.POST_IMAGE_MAX_SIDE
+    if image.format == 'JPEG':
+        # JPEG умеет декодироваться сразу в уменьшенном в 2-8 раз виде.
+        image.draft('RGB', (side, side))
+    image = _flatten(ImageOps.exif_transpose(image))
+    image.thumbnail((side, side), Image.LANCZOS)
+
+    name = os.path.splitext(os.path.basename(upload.name))[0] + '.jpg'
+    # Безымянный временный файл хранилище копирует кусками, а после
+    # закрытия он удаляется сам.
+    result = tempfile.TemporaryFile(suffix='.jpg')
+    image.save(
+        result, 'JPEG',
+        quality=settings.POST_IMAGE_QUALITY,
+        optimize=True,
+        progressive=True,
+    )
+    result.seek(0)
+    stored = DjangoImageFile(result, name=name)
+    # Размеры известны и так, второй раз заголовок читать незачем.
+    stored._dimensions_cache = image.size
+    stored.perceptual_hash = dhash(image)
+    return stored
+
+
+def _collect(name):
+    storage = Post._meta.get_field('image').storage
+    try:
+        # Под блокировкой хранилища файл не может быть «переиспользован»
+        # загрузкой между проверкой ссылок и удалением.
+        with storage.lock():
+            # Индекс по Post.image делает подсчёт ссылок дешёвым.
+            if (storage.claimed(name)
+                    or Post.objects.filter(image=name).exists()):
+                return
+            default.kvstore.delete(ImageFile(name, storage))
+            storage.delete(name)
+    except (OSError, SuspiciousFileOperation):
+        # Транзакция уже закоммичена, запрос из-за файла не должен падать.
+        logger.exception('Не удалось удалить картинку %s', name)
+
+
+def unclaim(name):
+    """Снимает с файла занятость после коммита сохранившего его поста."""
+    if name:
+        storage = Post._meta.get_field('image').storage
+        transaction.on_commit(lambda: storage.unclaim(name))
+
+
+def release(name):
+    """Удаляет файл картинки вместе с миниатюрами, если он больше не нужен.
+
+    Один файл может принадлежать нескольким постам, поэтому после коммита
+    проверяется, остались ли на него ссылки.
+    """
+    if name:
+        transaction.on_commit(lambda: _collect(name))
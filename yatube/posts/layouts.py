@@ -0,0 +1,61 @@
+from datetime import datetime
+
+from django.core.exceptions import ImproperlyConfigured
+from django.utils import timezone
+
+MAX_DEPTH = 4
+
+
+class Layout:
+    """Раскладка файлов хранилища по дереву каталогов ограниченной глубины.
+
+    directories() выбирает каталоги для нового файла по его хешу,
+    contains() проверяет, лежит ли уже сохранённый файл по правилам.
+    """
+
+    def __init__(self, depth):
+        if not 0 < depth <= MAX_DEPTH:
+            raise ImproperlyConfigured(
+                f'Глубина раскладки должна быть от 1 до {MAX_DEPTH}.')
+        self.depth = depth
+
+    def directories(self, digest):
+        raise NotImplementedError
+
+    def contains(self, directories, digest):
+        raise NotImplementedError
+
+
+class HashLayout(Layout):
+    """``ab/cd/<sha256>``: по 256 каталогов на каждом уровне."""
+
+    def directories(self, digest):
+        return [digest[level * 2:level * 2 + 2]
+                for level in range(self.depth)]
+
+    def contains(self, directories, digest):
+        return directories[-self.depth:] == self.directories(digest)
+
+
+class DateLayout(Layout):
+    """``2024/05/17/<sha256>``: год, месяц и день загрузки.
+
+    Одинаковые файлы объединяются, только если загружены в один день.
+    """
+
+    FORMATS = ('%Y', '%m', '%d', '%H')
+
+    def directories(self, digest):
+        now = timezone.now()
+        return [now.strftime(part) for part in self.FORMATS[:self.depth]]
+
+    def contains(self, directories, digest):
+        # Каталоги из цифр бывают и у HashLayout (``12/34``), поэтому
+        # путь должен разбираться как дата и собираться обратно тем же.
+        tail = '/'.join(directories[-self.depth:])
+        pattern = '/'.join(self.FORMATS[:self.depth])
+        try:
+            date = datetime.strptime(tail, pattern)
+        except ValueError:
+            return False
+        return date.strftime(pattern) == tail
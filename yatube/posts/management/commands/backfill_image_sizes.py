@@ -0,0 +1,52 @@
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.files.images import get_image_dimensions
+from django.core.management.base import BaseCommand
+
+from posts import caching
+from posts.models import Post
+
+
+class Command(BaseCommand):
+    help = ('Заполняет размеры картинок постов, читая только заголовки '
+            'файлов.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=settings.IMAGES_BATCH_SIZE,
+            help='Сколько постов обновлять одним запросом.')
+
+    def measure(self, post):
+        try:
+            with post.image.open('rb') as image:
+                return get_image_dimensions(image)
+        except (OSError, SuspiciousFileOperation) as error:
+            self.stderr.write(f'Пропущен пост {post.pk}: {error}')
+            return None, None
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        last_id = 0
+        done = 0
+        while True:
+            posts = list(Post.objects.filter(
+                pk__gt=last_id, image_width__isnull=True).exclude(
+                image='').order_by('pk').only(
+                'image', 'author', 'group')[:batch_size])
+            if not posts:
+                break
+            last_id = posts[-1].pk
+            measured = []
+            scopes = set()
+            for post in posts:
+                post.image_width, post.image_height = self.measure(post)
+                if post.image_width is not None:
+                    measured.append(post)
+                    scopes.update(caching.post_scopes(
+                        post.pk, post.author_id, post.group_id))
+            Post.objects.bulk_update(
+                measured, ['image_width', 'image_height'])
+            caching.bump(*scopes)
+            done += len(measured)
+            self.stdout.write(f'Обновлено постов: {done}')
+        self.stdout.write(self.style.SUCCESS('Размеры картинок заполнены'))
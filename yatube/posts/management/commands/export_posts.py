@@ -0,0 +1,61 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from posts import export
+
+
+class Command(BaseCommand):
+    help = ('Потоково выгружает посты или комментарии в JSONL или CSV. '
+            'Для инкрементальной выгрузки передайте --since-id с '
+            'последним id прошлого запуска.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--table', choices=tuple(export.TABLES), default='posts')
+        parser.add_argument(
+            '--format', choices=tuple(export.FORMATS), default='jsonl')
+        parser.add_argument(
+            '--since', help='Только записи не раньше этой даты (ISO 8601).')
+        parser.add_argument(
+            '--since-id', type=int, help='Только записи с id больше этого.')
+        parser.add_argument(
+            '--gzip', action='store_true', help='Сжимать вывод gzip.')
+        parser.add_argument(
+            '--output', help='Файл для выгрузки; по умолчанию stdout.')
+
+    def parse_since(self, value):
+        if value is None:
+            return None
+        try:
+            return export.parse_since(value)
+        except ValueError as error:
+            raise CommandError(error)
+
+    def track(self, records):
+        # Последний выгруженный id — водяной знак для следующего запуска.
+        for record in records:
+            self.last_id = record[0]
+            self.count += 1
+            yield record
+
+    def handle(self, *args, **options):
+        table = options['table']
+        records = export.rows(table, self.parse_since(options['since']),
+                              options['since_id'])
+        self.last_id = options['since_id']
+        self.count = 0
+        chunks = export.encode(
+            export.serialize(table, self.track(records), options['format']),
+            options['gzip'])
+        output = (open(options['output'], 'wb') if options['output']
+                  else sys.stdout.buffer)
+        try:
+            for chunk in chunks:
+                output.write(chunk)
+        finally:
+            if output is not sys.stdout.buffer:
+                output.close()
+        # stdout может быть занят самой выгрузкой.
+        self.stderr.write(
+            f'Выгружено записей: {self.count}, последний id: {self.last_id}')
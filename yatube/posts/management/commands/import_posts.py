@@ -0,0 +1,256 @@
+import csv
+import json
+import os
+import posixpath
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from itertools import islice
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.core.exceptions import ValidationError
+from django.core.files import File
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from posts import caching, duplicates, images, search, timeline
+from posts.models import Group, Post, User
+
+
+@contextmanager
+def original_dates():
+    # bulk_create вызывает pre_save, и auto_now_add затёр бы даты постов.
+    field = Post._meta.get_field('pub_date')
+    field.auto_now_add = False
+    try:
+        yield
+    finally:
+        field.auto_now_add = True
+
+
+class Command(BaseCommand):
+    help = ('Потоково загружает посты из JSONL или CSV, создавая '
+            'недостающих авторов и группы. Поля строки: author, text, '
+            'а также необязательные author_first_name, author_last_name, '
+            'group, group_title, pub_date и image (путь от --images-dir). '
+            'На SQLite запускать, пока посты больше никто не создаёт.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Файл для загрузки, - для stdin.')
+        parser.add_argument(
+            '--format', choices=('jsonl', 'csv'),
+            help='Формат файла; по умолчанию берётся из расширения.')
+        parser.add_argument(
+            '--batch-size', type=int, default=settings.IMPORT_BATCH_SIZE,
+            help='Сколько постов вставлять в одной транзакции.')
+        parser.add_argument(
+            '--images-dir', default='',
+            help='Каталог, относительно которого заданы картинки.')
+        parser.add_argument(
+            '--image-workers', type=int, default=0,
+            help='Потоков для копирования картинок; 0 — без пула.')
+
+    def read(self, stream, file_format):
+        if file_format == 'csv':
+            yield from csv.DictReader(stream)
+            return
+        for number, line in enumerate(stream, 1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError as error:
+                self.fail(f'строка {number}: {error}')
+                continue
+            if not isinstance(row, dict):
+                self.fail(f'строка {number}: ожидался объект, а не '
+                          f'{type(row).__name__}')
+                continue
+            yield row
+
+    def fail(self, message):
+        self.failed += 1
+        self.stderr.write(f'Пропущено: {message}')
+
+    def resolve(self, model, field, values, build):
+        """Возвращает id по значению уникального поля.
+
+        Карта значений в памяти растёт с числом разных авторов и групп, а
+        не постов; недостающие записи создаются одной вставкой.
+        """
+        ids = self.ids[model]
+        missing = {value for value in values if value not in ids}
+        if missing:
+            ids.update(model.objects.filter(
+                **{f'{field}__in': missing}).values_list(field, 'pk'))
+            new = [build(value) for value in missing if value not in ids]
+            if new:
+                model.objects.bulk_create(new, ignore_conflicts=True)
+                ids.update(model.objects.filter(**{
+                    f'{field}__in': [getattr(obj, field) for obj in new],
+                }).values_list(field, 'pk'))
+        return ids
+
+    def copy_image(self, path):
+        field = Post._meta.get_field('image')
+        try:
+            with open(os.path.join(self.images_dir, path), 'rb') as source:
+                image = images.ingest(File(source, name=path))
+            name = field.storage.save(
+                posixpath.join(field.upload_to, image.name), image)
+        except (OSError, ValidationError) as error:
+            return path, None, error
+        return path, {
+            'image': name,
+            'image_width': image.width,
+            'image_height': image.height,
+            'image_hash': image.perceptual_hash,
+        }, None
+
+    def copy_images(self, rows):
+        paths = {row['image'] for row in rows if row.get('image')}
+        copies = (self.pool.map(self.copy_image, paths) if self.pool
+                  else map(self.copy_image, paths))
+        copied = {}
+        for path, fields, error in copies:
+            if error is not None:
+                self.stderr.write(f'Картинка {path} не скопирована: {error}')
+            copied[path] = fields or {}
+        return copied
+
+    def build_post(self, row, authors, groups, copied):
+        pub_date = timezone.now()
+        if row.get('pub_date'):
+            pub_date = parse_datetime(row['pub_date'])
+            if pub_date is None:
+                raise ValueError(f'непонятная дата {row["pub_date"]!r}')
+            if timezone.is_naive(pub_date):
+                pub_date = timezone.make_aware(pub_date)
+        if row.get('group') and row['group'] not in groups:
+            raise ValueError(f'не удалось создать группу {row["group"]!r}')
+        return Post(
+            text=row['text'],
+            author_id=authors[row['author']],
+            group_id=groups.get(row.get('group')),
+            pub_date=pub_date,
+            **copied.get(row.get('image'), {}),
+        )
+
+    def last_id(self):
+        if connection.vendor == 'sqlite':
+            # AUTOINCREMENT не выдаёт id удалённых постов повторно, иначе
+            # старые ссылки /posts/<id>/ открыли бы чужие посты. Max(pk)
+            # этого не знает, а sqlite_sequence помнит.
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    'SELECT seq FROM sqlite_sequence WHERE name = %s',
+                    [Post._meta.db_table])
+                row = cursor.fetchone()
+            if row is not None:
+                return row[0]
+        return Post.objects.aggregate(last=Max('pk'))['last'] or 0
+
+    def allocate_ids(self, posts):
+        # Без RETURNING bulk_create не сообщает id, а они нужны лентам,
+        # поиску и индексу картинок.
+        if connection.features.can_return_ids_from_bulk_insert:
+            return
+        for pk, post in enumerate(posts, self.last_id() + 1):
+            post.pk = pk
+
+    def import_batch(self, rows):
+        self.author_names = {}
+        self.group_titles = {}
+        rows = [row for row in rows if self.check(row)]
+        copied = self.copy_images(rows)
+        with transaction.atomic(), original_dates():
+            authors = self.resolve(
+                User, 'username', {row['author'] for row in rows},
+                self.build_user)
+            groups = self.resolve(
+                Group, 'slug', {row['group'] for row in rows
+                                if row.get('group')},
+                lambda slug: Group(
+                    slug=slug, title=self.group_titles[slug],
+                    description=''))
+            posts = []
+            for row in rows:
+                try:
+                    posts.append(self.build_post(
+                        row, authors, groups, copied))
+                except ValueError as error:
+                    self.fail(str(error))
+            self.allocate_ids(posts)
+            Post.objects.bulk_create(posts)
+            timeline.fan_out_many(posts)
+            search.index_new_posts(posts)
+            duplicates.index_new_posts(posts)
+            scopes = {caching.INDEX}
+            for post in posts:
+                scopes.update(caching.post_scopes(
+                    post.pk, post.author_id, post.group_id))
+            caching.bump(*scopes)
+        return len(posts)
+
+    def build_user(self, username):
+        first_name, last_name = self.author_names.get(username, ('', ''))
+        return User(username=username, first_name=first_name,
+                    last_name=last_name, password=make_password(None))
+
+    def check(self, row):
+        if not row.get('author') or not row.get('text'):
+            self.fail(f'нет автора или текста: {row!r:.100}')
+            return False
+        # Имена и названия нужны только при создании, поэтому в памяти
+        # держатся лишь до конца пачки.
+        self.author_names[row['author']] = (
+            row.get('author_first_name') or '',
+            row.get('author_last_name') or '')
+        if row.get('group'):
+            self.group_titles[row['group']] = (
+                row.get('group_title') or row['group'])
+        return True
+
+    def handle(self, *args, **options):
+        path = options['path']
+        file_format = options['format'] or (
+            'csv' if path.endswith('.csv') else 'jsonl')
+        self.images_dir = options['images_dir']
+        self.ids = {User: {}, Group: {}}
+        self.failed = 0
+        self.pool = None
+        if options['image_workers'] > 0:
+            self.pool = ThreadPoolExecutor(
+                max_workers=options['image_workers'])
+        try:
+            stream = (sys.stdin if path == '-'
+                      else open(path, newline='', encoding='utf-8'))
+        except OSError as error:
+            raise CommandError(error)
+        started = time.monotonic()
+        imported = 0
+        try:
+            rows = self.read(stream, file_format)
+            while True:
+                batch = list(islice(rows, options['batch_size']))
+                if not batch:
+                    break
+                imported += self.import_batch(batch)
+                elapsed = max(time.monotonic() - started, 1e-6)
+                self.stdout.write(f'Загружено постов: {imported}, '
+                                  f'{imported / elapsed:.0f} строк/с')
+        finally:
+            if stream is not sys.stdin:
+                stream.close()
+            if self.pool is not None:
+                self.pool.shutdown()
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Готово: {imported} постов за {elapsed:.1f} с, '
+            f'пропущено строк: {self.failed}. Миниатюры создаст '
+            f'manage.py regenerate_thumbnails.'))
@@ -0,0 +1,70 @@
+import posixpath
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from posts import caching, images, thumbnails
+from posts.models import Post
+
+
+class Command(BaseCommand):
+    help = ('Переносит картинки постов в текущую раскладку каталогов '
+            '(POST_IMAGE_LAYOUT) и переписывает пути в базе.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=settings.IMAGES_BATCH_SIZE,
+            help='Сколько постов просматривать за раз.')
+
+    def move(self, field, name):
+        """Копирует файл на новое место и переключает на него посты.
+
+        Старый файл удаляется только после коммита, так что до него
+        страницы продолжают открываться.
+        """
+        storage = field.storage
+        try:
+            with storage.open(name) as source:
+                new_name = storage.save(posixpath.join(
+                    field.upload_to, posixpath.basename(name)), source)
+        except (OSError, SuspiciousFileOperation) as error:
+            self.stderr.write(f'Пропущен {name}: {error}')
+            return 0
+        with transaction.atomic():
+            posts = list(Post.objects.select_for_update().filter(
+                image=name).only('author_id', 'group_id'))
+            Post.objects.filter(image=name).update(image=new_name)
+            for post in posts:
+                caching.bump(*caching.post_scopes(
+                    post.pk, post.author_id, post.group_id))
+            if posts:
+                post = posts[0]
+                post.image = new_name
+                thumbnails.enqueue(post)
+            images.release(name)
+        return len(posts)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        field = Post._meta.get_field('image')
+        last_id = 0
+        moved = 0
+        while True:
+            # Уже разложенные файлы пропускаются, поэтому прерванный
+            # перенос можно просто запустить ещё раз.
+            batch = list(Post.objects.filter(pk__gt=last_id).exclude(
+                image='').order_by('pk').values_list('pk', 'image')[
+                :batch_size])
+            if not batch:
+                break
+            last_id = batch[-1][0]
+            names = {name for _, name in batch
+                     if not field.storage.laid_out(name)}
+            for name in sorted(names):
+                moved += self.move(field, name)
+            self.stdout.write(f'Просмотрено до поста {last_id}, '
+                              f'перенесено постов: {moved}')
+        self.stdout.write(self.style.SUCCESS(
+            f'Картинки разложены, перенесено постов: {moved}'))
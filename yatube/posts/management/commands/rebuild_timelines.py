@@ -0,0 +1,34 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from posts import timeline
+from posts.models import Follow, TimelineEntry
+
+
+class Command(BaseCommand):
+    help = 'Пересобирает ленты подписок из таблицы подписок.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=settings.TIMELINE_BATCH_SIZE,
+            help='Сколько подписок обрабатывать в одной транзакции.')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        TimelineEntry.objects.all().delete()
+        last_id = 0
+        done = 0
+        while True:
+            follows = list(Follow.objects.filter(pk__gt=last_id).order_by(
+                'pk').values_list('pk', 'user_id', 'author_id')[:batch_size])
+            if not follows:
+                break
+            with transaction.atomic():
+                for pk, user_id, author_id in follows:
+                    timeline.backfill(user_id, author_id)
+            last_id = follows[-1][0]
+            done += len(follows)
+            self.stdout.write(f'Обработано подписок: {done}')
+        self.stdout.write(self.style.SUCCESS(
+            f'Записей в лентах: {TimelineEntry.objects.count()}'))
@@ -0,0 +1,40 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db.models import Count, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from posts.models import Comment, Dislikes, Likes, Post
+
+
+def count_for(model):
+    counts = model.objects.filter(post=OuterRef('pk')).order_by().values(
+        'post').annotate(total=Count('pk')).values('total')
+    return Coalesce(Subquery(counts, output_field=IntegerField()), 0)
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает счётчики лайков, дизлайков и комментариев.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=settings.COUNTERS_BATCH_SIZE,
+            help='Сколько постов пересчитывать одним запросом.')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        last_id = 0
+        done = 0
+        while True:
+            ids = list(Post.objects.filter(pk__gt=last_id).order_by(
+                'pk').values_list('pk', flat=True)[:batch_size])
+            if not ids:
+                break
+            Post.objects.filter(pk__gte=ids[0], pk__lte=ids[-1]).update(
+                likes_count=count_for(Likes),
+                dislikes_count=count_for(Dislikes),
+                comments_count=count_for(Comment),
+            )
+            last_id = ids[-1]
+            done += len(ids)
+            self.stdout.write(f'Пересчитано постов: {done}')
+        self.stdout.write(self.style.SUCCESS('Счётчики пересчитаны'))
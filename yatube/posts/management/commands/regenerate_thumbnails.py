@@ -0,0 +1,115 @@
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from posts import caching, thumbnails
+from posts.models import Post
+
+
+def _render(name):
+    try:
+        return name, thumbnails.render(name), None
+    except Exception as error:
+        return name, None, str(error)
+
+
+class Command(BaseCommand):
+    help = ('Пересоздаёт все варианты миниатюр картинок постов в пуле '
+            'процессов, с возможностью продолжить после прерывания.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=settings.IMAGES_BATCH_SIZE,
+            help='Сколько постов обрабатывать за один шаг.')
+        parser.add_argument(
+            '--workers', type=int, default=os.cpu_count() or 1,
+            help='Число процессов; 0 — всё в текущем процессе.')
+        parser.add_argument(
+            '--progress-file',
+            default=os.path.join(settings.BASE_DIR,
+                                 'regenerate_thumbnails.json'),
+            help='Где хранить номер последнего обработанного поста.')
+        parser.add_argument(
+            '--restart', action='store_true',
+            help='Начать сначала, не глядя на сохранённый прогресс.')
+
+    def load_progress(self, path, restart):
+        if restart or not os.path.exists(path):
+            return 0
+        with open(path) as progress:
+            return json.load(progress)['last_id']
+
+    def save_progress(self, path, last_id):
+        temp_path = path + '.tmp'
+        with open(temp_path, 'w') as progress:
+            json.dump({'last_id': last_id}, progress)
+        os.replace(temp_path, path)
+
+    def save_savings(self, batch, savings):
+        # Один UPDATE на каждое различное значение экономии в пачке.
+        posts = {}
+        for pk, name, _, _ in batch:
+            if name in savings:
+                posts.setdefault(savings[name], []).append(pk)
+        for saved, pks in posts.items():
+            Post.objects.filter(pk__in=pks).update(image_webp_savings=saved)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        path = options['progress_file']
+        last_id = self.load_progress(path, options['restart'])
+        if last_id:
+            self.stdout.write(f'Продолжаем после поста {last_id}')
+        pool = None
+        if options['workers'] > 0:
+            # Дочерним процессам не должны достаться открытые соединения.
+            connections.close_all()
+            pool = ProcessPoolExecutor(max_workers=options['workers'])
+        started = time.monotonic()
+        images = made = failed = 0
+        try:
+            while True:
+                batch = list(Post.objects.filter(pk__gt=last_id).exclude(
+                    image='').order_by('pk').values_list(
+                    'pk', 'image', 'author_id', 'group_id')[:batch_size])
+                if not batch:
+                    break
+                names = sorted({row[1] for row in batch})
+                savings = {}
+                results = (pool.map(_render, names) if pool
+                           else map(_render, names))
+                for name, result, error in results:
+                    if error is not None:
+                        failed += 1
+                        self.stderr.write(f'Пропущен {name}: {error}')
+                        continue
+                    thumbnails.store(name, *result)
+                    savings[name] = thumbnails.webp_savings(result[1])
+                    images += 1
+                    made += len(result[1])
+                self.save_savings(batch, savings)
+                scopes = set()
+                for pk, _, author_id, group_id in batch:
+                    scopes.update(caching.post_scopes(pk, author_id, group_id))
+                caching.bump(*scopes)
+                last_id = batch[-1][0]
+                self.save_progress(path, last_id)
+                elapsed = max(time.monotonic() - started, 1e-6)
+                self.stdout.write(
+                    f'До поста {last_id}: картинок {images}, миниатюр '
+                    f'{made}, ошибок {failed}; '
+                    f'{images / elapsed:.1f} картинок/с')
+        finally:
+            if pool is not None:
+                pool.shutdown()
+        if os.path.exists(path):
+            os.remove(path)
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Готово: {images} картинок, {made} миниатюр '
+            f'за {elapsed:.1f} с'))
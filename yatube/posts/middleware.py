@@ -0,0 +1,50 @@
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.cache import patch_cache_control, patch_vary_headers
+
+from . import caching, thumbnails
+
+
+class AnonymousPageCacheMiddleware:
+    """Кеширует целые страницы для анонимных читателей.
+
+    Кешируются только ответы, помеченные caching.tag_response: вместе с
+    ответом хранятся поколения его областей, и запись считается
+    устаревшей, как только любое из них сброшено сигналами. Заголовок
+    экономии WebP зависит от Accept и ставится уже после кеша.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        return thumbnails.report_savings(request, self.cached(request))
+
+    def cached(self, request):
+        anonymous = (request.method in ('GET', 'HEAD')
+                     and not request.user.is_authenticated)
+        if anonymous:
+            key = 'anonymous-page:' + hashlib.md5(
+                request.get_full_path().encode()).hexdigest()
+            entry = cache.get(key)
+            if entry is not None:
+                version, response = entry
+                if caching.generation(*caching.scopes_of(version)) == version:
+                    return response
+        response = self.get_response(request)
+        version = getattr(response, 'surrogate_version', None)
+        if version is None:
+            return response
+        patch_vary_headers(response, ('Cookie',))
+        if not anonymous:
+            patch_cache_control(response, private=True)
+            return response
+        patch_cache_control(
+            response, public=True, max_age=settings.ANONYMOUS_CACHE_MAX_AGE)
+        if (request.method == 'GET' and response.status_code == 200
+                and not response.streaming and not response.cookies):
+            cache.set(key, (version, response),
+                      settings.ANONYMOUS_CACHE_TIMEOUT)
+        return response
@@ -0,0 +1,49 @@
+# Generated by Django 2.2.16 on 2026-10-18 03:09
+
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count_for(model):
+    # Копия reconcile_counters.count_for: миграция не должна зависеть
+    # от текущего кода команды.
+    counts = model.objects.filter(post=OuterRef('pk')).order_by().values(
+        'post').annotate(total=Count('pk')).values('total')
+    return Coalesce(Subquery(counts, output_field=IntegerField()), 0)
+
+
+def fill_counters(apps, schema_editor):
+    # Реакции и комментарии, созданные до появления счётчиков.
+    Post = apps.get_model('posts', 'Post')
+    Post.objects.update(
+        likes_count=count_for(apps.get_model('posts', 'Likes')),
+        dislikes_count=count_for(apps.get_model('posts', 'Dislikes')),
+        comments_count=count_for(apps.get_model('posts', 'Comment')),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0002_timelineentry'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='comments_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Комментарии'),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='dislikes_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Дизлайки'),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='likes_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Лайки'),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 2.2.16 on 2026-10-18 03:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0006_post_image_size'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='image_webp_savings',
+            field=models.IntegerField(default=0, editable=False, verbose_name='Экономия WebP, байт'),
+        ),
+    ]
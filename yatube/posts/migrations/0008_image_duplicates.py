@@ -0,0 +1,58 @@
+# Generated by Django 2.2.16 on 2026-10-18 03:33
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0007_post_image_webp_savings'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DuplicateCluster',
+            fields=[
+            ],
+            options={
+                'verbose_name': 'Похожие картинки',
+                'verbose_name_plural': 'Похожие картинки',
+                'proxy': True,
+                'indexes': [],
+                'constraints': [],
+            },
+            bases=('posts.post',),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='duplicate_of',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='duplicates', to='posts.Post', verbose_name='Похож на пост'),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='image_hash',
+            field=models.BigIntegerField(blank=True, editable=False, null=True, verbose_name='Перцептивный хеш картинки'),
+        ),
+        migrations.CreateModel(
+            name='ImageHashBand',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('band', models.PositiveSmallIntegerField(verbose_name='Номер полосы')),
+                ('value', models.PositiveIntegerField(verbose_name='Значение')),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='hash_bands', to='posts.Post', verbose_name='Пост')),
+            ],
+            options={
+                'verbose_name': 'Полоса хеша картинки',
+                'verbose_name_plural': 'Полосы хешей картинок',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='imagehashband',
+            index=models.Index(fields=['band', 'value'], name='image_hash_band_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='imagehashband',
+            unique_together={('post', 'band')},
+        ),
+    ]
@@ -0,0 +1,70 @@
+# Generated by Django 2.2.16 on 2026-10-18 03:43
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+# Модель -> поля будущего ограничения уникальности и счётчик поста.
+PAIRS = (
+    ('Follow', ('user', 'author'), None),
+    ('Likes', ('user', 'post'), 'likes_count'),
+    ('Dislikes', ('user', 'post'), 'dislikes_count'),
+)
+
+
+def remove_duplicates(apps, schema_editor):
+    # Гонки get_or_create могли создать одинаковые строки; остаётся
+    # самая ранняя, а счётчик затронутого поста пересчитывается.
+    Post = apps.get_model('posts', 'Post')
+    for model_name, fields, counter in PAIRS:
+        model = apps.get_model('posts', model_name)
+        duplicates = model.objects.values(*fields).annotate(
+            keep=Min('pk'), copies=Count('pk')).filter(
+            copies__gt=1).order_by()
+        for row in duplicates.iterator():
+            model.objects.filter(
+                **{field: row[field] for field in fields}).exclude(
+                pk=row['keep']).delete()
+            if counter is not None and row['post'] is not None:
+                Post.objects.filter(pk=row['post']).update(**{
+                    counter: model.objects.filter(post=row['post']).count()})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('posts', '0008_image_duplicates'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicates, migrations.RunPython.noop),
+        migrations.AlterUniqueTogether(
+            name='dislikes',
+            unique_together={('user', 'post')},
+        ),
+        migrations.AlterUniqueTogether(
+            name='follow',
+            unique_together={('user', 'author')},
+        ),
+        migrations.AlterUniqueTogether(
+            name='likes',
+            unique_together={('user', 'post')},
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['post', '-created'], name='comment_post_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['-pub_date', '-id'], name='post_feed_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['author', '-pub_date', '-id'], name='post_author_feed_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['group', '-pub_date', '-id'], name='post_group_feed_idx'),
+        ),
+    ]
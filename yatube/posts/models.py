@@ -2,8 +2,25 @@ from django.db import models
 from django.contrib.auth import get_user_model
 from django.conf import settings
 
+from .storage import ContentAddressedStorage
+
 User = get_user_model()
 
+FEED_FIELDS = (
+    'text', 'pub_date', 'image', 'image_width', 'image_height',
+    'image_webp_savings',
+    'likes_count', 'dislikes_count',
+    'author__username', 'author__first_name', 'author__last_name',
+    'group__slug',
+)
+
+
+class PostQuerySet(models.QuerySet):
+
+    def feed(self):
+        """Посты для карточек ленты: автор и группа одним запросом."""
+        return self.select_related('author', 'group').only(*FEED_FIELDS)
+
 
 class Post(models.Model):
     text = models.TextField(
@@ -33,11 +50,51 @@ class Post(models.Model):
     image = models.ImageField(
         'Картинка',
         upload_to='posts/',
-        blank=True
+        storage=ContentAddressedStorage(),
+        blank=True,
+        db_index=True,
     )
+    # Размеры заполняет форма при загрузке. width_field не подходит: пока
+    # размеры не записаны, он открывает файл при каждой загрузке поста из
+    # базы, а на отсутствующем файле падает.
+    image_width = models.PositiveIntegerField(
+        'Ширина картинки', null=True, blank=True, editable=False)
+    image_height = models.PositiveIntegerField(
+        'Высота картинки', null=True, blank=True, editable=False)
+    image_webp_savings = models.IntegerField(
+        'Экономия WebP, байт', default=0, editable=False)
+    image_hash = models.BigIntegerField(
+        'Перцептивный хеш картинки', null=True, blank=True, editable=False)
+    duplicate_of = models.ForeignKey(
+        'self',
+        null=True,
+        blank=True,
+        editable=False,
+        on_delete=models.SET_NULL,
+        related_name='duplicates',
+        verbose_name='Похож на пост'
+    )
+
+    likes_count = models.PositiveIntegerField(
+        'Лайки', default=0, editable=False)
+    dislikes_count = models.PositiveIntegerField(
+        'Дизлайки', default=0, editable=False)
+    comments_count = models.PositiveIntegerField(
+        'Комментарии', default=0, editable=False)
+
+    objects = PostQuerySet.as_manager()
 
     class Meta:
         ordering = ('-pub_date',)
+        # Ленты сортируются по (pub_date, id), см. utils.FEED_KEYS.
+        indexes = [
+            models.Index(fields=['-pub_date', '-id'],
+                         name='post_feed_idx'),
+            models.Index(fields=['author', '-pub_date', '-id'],
+                         name='post_author_feed_idx'),
+            models.Index(fields=['group', '-pub_date', '-id'],
+                         name='post_group_feed_idx'),
+        ]
         verbose_name = 'Пост'
         verbose_name_plural = 'Посты'
 
@@ -79,6 +136,10 @@ class Comment(models.Model):
 
     class Meta:
         ordering = ('-created',)
+        indexes = [
+            models.Index(fields=['post', '-created'],
+                         name='comment_post_created_idx'),
+        ]
         verbose_name = 'Комментарий',
         verbose_name_plural = 'Comment'
 
@@ -100,6 +161,7 @@ class Follow(models.Model):
     )
 
     class Meta:
+        unique_together = ('user', 'author')
         verbose_name = 'Follow',
         verbose_name_plural = 'Following'
 
@@ -123,6 +185,9 @@ class Likes(models.Model):
         help_text='Пост к которому относится лайк'
     )
 
+    class Meta:
+        unique_together = ('user', 'post')
+
 
 class Dislikes(models.Model):
 
@@ -142,3 +207,69 @@ class Dislikes(models.Model):
         verbose_name='Дизлайк',
         help_text='Пост к которому относится дизлайк'
     )
+
+    class Meta:
+        unique_together = ('user', 'post')
+
+
+class TimelineEntry(models.Model):
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='timeline',
+        verbose_name='Подписчик'
+    )
+
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name='timeline_entries',
+        verbose_name='Пост'
+    )
+
+    pub_date = models.DateTimeField()
+
+    class Meta:
+        unique_together = ('user', 'post')
+        indexes = [
+            models.Index(fields=['user', '-pub_date', '-post'],
+                         name='timeline_user_feed_idx'),
+        ]
+        verbose_name = 'Запись ленты'
+        verbose_name_plural = 'Ленты подписок'
+
+
+class ImageHashBand(models.Model):
+    """Кусок перцептивного хеша картинки поста для поиска похожих.
+
+    Хеш режется на полосы; у хешей, отличающихся не больше чем в
+    (число полос - 1) битах, хотя бы одна полоса совпадает целиком,
+    поэтому кандидатов находит точный поиск по индексу.
+    """
+
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name='hash_bands',
+        verbose_name='Пост'
+    )
+    band = models.PositiveSmallIntegerField('Номер полосы')
+    value = models.PositiveIntegerField('Значение')
+
+    class Meta:
+        unique_together = ('post', 'band')
+        indexes = [
+            models.Index(fields=['band', 'value'],
+                         name='image_hash_band_idx'),
+        ]
+        verbose_name = 'Полоса хеша картинки'
+        verbose_name_plural = 'Полосы хешей картинок'
+
+
+class DuplicateCluster(Post):
+
+    class Meta:
+        proxy = True
+        verbose_name = 'Похожие картинки'
+        verbose_name_plural = 'Похожие картинки'
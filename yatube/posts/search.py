@@ -0,0 +1,107 @@
+from django.db import connection
+from django.db.models import FloatField
+from django.utils.html import escape
+from django.utils.safestring import mark_safe
+
+from .models import Post
+from .utils import CursorPaginator
+
+TABLE = 'posts_post_fts'
+# Служебные символы не встречаются в тексте поста: по ним после
+# экранирования сниппета расставляются теги подсветки.
+MARK_START, MARK_END = '\x02', '\x03'
+
+
+def enabled():
+    return connection.vendor == 'sqlite'
+
+
+def match_expression(query):
+    """Запрос пользователя как набор слов FTS5, без операторов."""
+    words = query.split()
+    return ' '.join('"{}"'.format(word.replace('"', '""')) for word in words)
+
+
+def index_post(post):
+    if not enabled():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {TABLE} WHERE rowid = %s', [post.pk])
+        cursor.execute(f'INSERT INTO {TABLE} (rowid, text) VALUES (%s, %s)',
+                       [post.pk, post.text])
+
+
+def index_new_posts(posts):
+    """Добавляет в индекс пачку только что созданных постов."""
+    if not enabled() or not posts:
+        return
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            f'INSERT INTO {TABLE} (rowid, text) VALUES (%s, %s)',
+            [(post.pk, post.text) for post in posts])
+
+
+def unindex_post(post_id):
+    if not enabled():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {TABLE} WHERE rowid = %s', [post_id])
+
+
+def filter_matching(queryset, query):
+    """Оставляет в queryset постов только подходящие под запрос."""
+    table = queryset.model._meta.db_table
+    return queryset.extra(
+        where=[f'{table}.id IN (SELECT rowid FROM {TABLE} '
+               f'WHERE {TABLE} MATCH %s)'],
+        params=[match_expression(query)])
+
+
+def highlight(snippet):
+    return mark_safe(escape(snippet).replace(
+        MARK_START, '<mark>').replace(MARK_END, '</mark>'))
+
+
+class SearchPaginator(CursorPaginator):
+    """Результаты поиска по релевантности с курсором (rank, id)."""
+
+    def __init__(self, query, per_page):
+        self.query = match_expression(query)
+        super().__init__(Post.objects.feed(), per_page,
+                         keys=('search_rank', 'pk'))
+
+    def order(self, object_list):
+        return object_list
+
+    def cursor_field(self, key):
+        if key == 'search_rank':
+            return FloatField()
+        return super().cursor_field(key)
+
+    def fetch(self, values, reverse):
+        if not self.query:
+            return []
+        # rank у FTS5 отрицательный: чем меньше, тем релевантнее.
+        sql = [f"SELECT rowid, rank, snippet({TABLE}, 0, '{MARK_START}', "
+               f"'{MARK_END}', '…', 24) FROM {TABLE} "
+               f'WHERE {TABLE} MATCH %s']
+        params = [self.query]
+        sign, direction = ('<', 'DESC') if reverse else ('>', 'ASC')
+        if values is not None:
+            sql.append(f'AND (rank {sign} %s OR '
+                       f'(rank = %s AND rowid {sign} %s))')
+            params += [values[0], values[0], values[1]]
+        sql.append(f'ORDER BY rank {direction}, rowid {direction} LIMIT %s')
+        params.append(self.per_page + 1)
+        with connection.cursor() as cursor:
+            cursor.execute(' '.join(sql), params)
+            rows = cursor.fetchall()
+        posts = self.object_list.in_bulk([row[0] for row in rows])
+        results = []
+        for post_id, rank, snippet in rows:
+            if post_id in posts:
+                post = posts[post_id]
+                post.search_rank = rank
+                post.snippet = highlight(snippet)
+                results.append(post)
+        return results
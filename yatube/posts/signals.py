@@ -0,0 +1,118 @@
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from . import archive, caching, duplicates, images, search, timeline
+from .models import Comment, Dislikes, Follow, Group, Likes, Post
+
+
+@receiver(post_save, sender=Post)
+def post_created(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        timeline.fan_out(instance)
+
+
+@receiver(post_save, sender=Follow)
+def follow_created(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        timeline.backfill(instance.user_id, instance.author_id)
+
+
+@receiver(post_delete, sender=Follow)
+def follow_deleted(sender, instance, **kwargs):
+    timeline.prune(instance.user_id, instance.author_id)
+
+
+@receiver(pre_save, sender=Post)
+def post_moving(sender, instance, raw=False, **kwargs):
+    # Пост могли перенести в другую группу: сбрасываем и старые области.
+    if instance.pk is not None and not raw:
+        caching.bump_post(instance.pk)
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+def post_changed(sender, instance, raw=False, **kwargs):
+    if not raw:
+        caching.bump(*caching.post_scopes(
+            instance.pk, instance.author_id, instance.group_id))
+
+
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+@receiver(post_save, sender=Likes)
+@receiver(post_delete, sender=Likes)
+@receiver(post_save, sender=Dislikes)
+@receiver(post_delete, sender=Dislikes)
+def reaction_changed(sender, instance, raw=False, **kwargs):
+    if instance.post_id is not None and not raw:
+        caching.bump_post(instance.post_id)
+
+
+@receiver(post_save, sender=Follow)
+@receiver(post_delete, sender=Follow)
+def subscriptions_changed(sender, instance, raw=False, **kwargs):
+    # Профили обоих пользователей показывают число подписок.
+    if not raw:
+        caching.bump(caching.follow_scope(instance.user_id),
+                     caching.author_scope(instance.user_id),
+                     caching.author_scope(instance.author_id))
+
+
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+def group_changed(sender, instance, raw=False, **kwargs):
+    if not raw:
+        caching.bump(caching.group_scope(instance.pk))
+
+
+@receiver(post_save, sender=Post)
+def post_indexed(sender, instance, raw=False, update_fields=None, **kwargs):
+    if not raw and (update_fields is None or 'text' in update_fields):
+        search.index_post(instance)
+
+
+@receiver(post_delete, sender=Post)
+def post_unindexed(sender, instance, **kwargs):
+    search.unindex_post(instance.pk)
+
+
+@receiver(pre_save, sender=Post)
+def post_image_replacing(sender, instance, raw=False, **kwargs):
+    instance._stored_image = None
+    if instance.pk is not None and not raw:
+        instance._stored_image = Post.objects.filter(
+            pk=instance.pk).values_list('image', flat=True).first()
+
+
+@receiver(post_save, sender=Post)
+def post_image_replaced(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    stored = getattr(instance, '_stored_image', None)
+    if stored and stored != instance.image.name:
+        images.release(stored)
+    if created or stored != instance.image.name:
+        images.unclaim(instance.image.name)
+        duplicates.index_post(instance)
+
+
+@receiver(post_delete, sender=Post)
+def post_image_released(sender, instance, **kwargs):
+    images.release(instance.image.name)
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+@receiver(post_save, sender=Likes)
+@receiver(post_delete, sender=Likes)
+@receiver(post_save, sender=Dislikes)
+@receiver(post_delete, sender=Dislikes)
+@receiver(post_save, sender=Follow)
+@receiver(post_delete, sender=Follow)
+def archive_outdated(sender, instance, raw=False, **kwargs):
+    # Готовый архив «скачать мои данные» больше не отдаётся.
+    if not raw:
+        caching.bump(caching.archive_scope(
+            getattr(instance, archive.OWNERS[sender])))
@@ -0,0 +1,149 @@
+import hashlib
+import os
+import posixpath
+import re
+import tempfile
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files import locks
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+from django.utils.module_loading import import_string
+
+DIGEST = re.compile(r'^[0-9a-f]{64}$')
+
+
+@deconstructible
+class OverwriteStorage(FileSystemStorage):
+    """Файловое хранилище, которое атомарно перезаписывает файлы.
+
+    Файл пишется во временный рядом с целевым и переносится на место
+    через os.replace, так что читатель видит либо старую, либо новую
+    версию целиком. Используется для миниатюр sorl-thumbnail.
+    """
+
+    def get_available_name(self, name, max_length=None):
+        return name
+
+    def _makedirs(self, directory):
+        if self.directory_permissions_mode is None:
+            os.makedirs(directory, exist_ok=True)
+            return
+        old_umask = os.umask(0o777 & ~self.directory_permissions_mode)
+        try:
+            os.makedirs(
+                directory, self.directory_permissions_mode, exist_ok=True)
+        finally:
+            os.umask(old_umask)
+
+    def _write_temp(self, directory, content, digest=None):
+        self._makedirs(directory)
+        fd, temp_path = tempfile.mkstemp(dir=directory, suffix='.part')
+        try:
+            with os.fdopen(fd, 'wb') as temp:
+                for chunk in content.chunks():
+                    if digest is not None:
+                        digest.update(chunk)
+                    temp.write(chunk)
+            os.chmod(temp_path, self.file_permissions_mode or 0o644)
+        except BaseException:
+            os.remove(temp_path)
+            raise
+        return temp_path
+
+    def _save(self, name, content):
+        full_path = self.path(name)
+        os.replace(
+            self._write_temp(os.path.dirname(full_path), content), full_path)
+        return name.replace('\\', '/')
+
+
+@deconstructible
+class ContentAddressedStorage(OverwriteStorage):
+    """Хранилище, в котором имя файла — sha256 его содержимого.
+
+    Файл из каталога upload_to кладётся по пути вида
+    ``posts/ab/cd/<sha256>.jpg``: одинаковые загрузки сохраняются один раз
+    и делят между постами и сам файл, и его миниатюры. Удалять файлы,
+    на которые больше не ссылаются посты, должен вызывающий код.
+
+    Подкаталоги выбирает раскладка из POST_IMAGE_LAYOUT глубиной
+    POST_IMAGE_LAYOUT_DEPTH, см. posts.layouts.
+
+    Сохранённый файл, новый или уже существовавший, «занят» до коммита
+    ссылающегося на него поста, но не дольше POST_IMAGE_CLAIM_TIMEOUT.
+    Сборщик мусора проверяет ссылки и занятость и удаляет файл под тем
+    же lock(), что и сохранение.
+    """
+
+    @property
+    def layout(self):
+        return import_string(settings.POST_IMAGE_LAYOUT)(
+            settings.POST_IMAGE_LAYOUT_DEPTH)
+
+    def content_name(self, name, digest):
+        directory, filename = posixpath.split(name)
+        extension = os.path.splitext(filename)[1].lower()
+        return posixpath.join(
+            directory, *self.layout.directories(digest), digest + extension)
+
+    def laid_out(self, name):
+        """Лежит ли файл по правилам текущей раскладки."""
+        directory, filename = posixpath.split(name)
+        digest = os.path.splitext(filename)[0]
+        return bool(DIGEST.match(digest)) and self.layout.contains(
+            directory.split('/'), digest)
+
+    @contextmanager
+    def lock(self):
+        """Блокировка хранилища между процессами: сохранение и удаление."""
+        self._makedirs(self.location)
+        with open(os.path.join(self.location, '.lock'), 'wb') as lock_file:
+            locks.lock(lock_file, locks.LOCK_EX)
+            try:
+                yield
+            finally:
+                locks.unlock(lock_file)
+
+    def _claim_key(self, name):
+        return f'image-claim:{name}'
+
+    def claim(self, name):
+        key = self._claim_key(name)
+        cache.add(key, 0, settings.POST_IMAGE_CLAIM_TIMEOUT)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.add(key, 1, settings.POST_IMAGE_CLAIM_TIMEOUT)
+
+    def unclaim(self, name):
+        try:
+            cache.decr(self._claim_key(name))
+        except ValueError:
+            pass
+
+    def claimed(self, name):
+        return cache.get(self._claim_key(name), 0) > 0
+
+    def _save(self, name, content):
+        # Содержимое хешируется по ходу записи во временный файл рядом с
+        # хранилищем, а имя файла становится известно только после этого.
+        digest = hashlib.sha256()
+        temp_path = self._write_temp(self.location, content, digest)
+        try:
+            name = self.content_name(name, digest.hexdigest())
+            full_path = self.path(name)
+            with self.lock():
+                if os.path.exists(full_path):
+                    os.remove(temp_path)
+                else:
+                    self._makedirs(os.path.dirname(full_path))
+                    os.replace(temp_path, full_path)
+                self.claim(name)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        return name
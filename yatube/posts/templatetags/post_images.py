@@ -0,0 +1,44 @@
+from django import template
+from django.conf import settings
+
+from .. import thumbnails
+
+register = template.Library()
+
+
+def _srcset(ready, names, suffix=''):
+    items = [ready.get(name + suffix) for name in names]
+    return ', '.join(f'{item.url} {item.width}w' for item in items if item)
+
+
+@register.inclusion_tag('posts/includes/post_image.html')
+def post_image(post, variant=thumbnails.DEFAULT_VARIANT):
+    """Миниатюра картинки поста с размерами, srcset и WebP-копиями.
+
+    Пока миниатюры нет, выводится оригинал с размерами из базы, так что
+    файлы картинок при отрисовке не открываются.
+    """
+    if not post.image:
+        return {}
+    if getattr(post, 'ready_thumbnails', None) is None:
+        thumbnails.prefetch([post])
+    ready = post.ready_thumbnails
+    thumbnail = ready.get(variant)
+    if thumbnail is None:
+        return {'src': post.image.url, 'width': post.image_width,
+                'height': post.image_height}
+    names = settings.POST_THUMBNAIL_SRCSET.get(variant, (variant,))
+    return {
+        'src': thumbnail.url,
+        'width': thumbnail.width,
+        'height': thumbnail.height,
+        'srcset': _srcset(ready, names),
+        'webp_srcset': _srcset(ready, names, thumbnails.WEBP),
+    }
+
+
+@register.simple_tag
+def prefetch_thumbnails(posts):
+    """Загружает миниатюры страницы одним пакетом, см. thumbnails.prefetch."""
+    thumbnails.prefetch(posts)
+    return ''
@@ -0,0 +1,55 @@
+import re
+
+from django import template
+from django.utils.safestring import mark_safe
+
+register = template.Library()
+
+HOLE = re.compile(r'<!--hole:(\w+):(\d+)-->')
+HOLE_TEMPLATES = {
+    'reactions': 'posts/includes/like.html',
+    'controls': 'posts/includes/controls.html',
+}
+
+
+@register.simple_tag
+def hole(name, post):
+    """Метка на месте персональной части карточки в общем кеше."""
+    return mark_safe(f'<!--hole:{name}:{post.pk}-->')
+
+
+class FillHolesNode(template.Node):
+
+    def __init__(self, nodelist, posts):
+        self.nodelist = nodelist
+        self.posts = posts
+
+    def render(self, context):
+        html = self.nodelist.render(context)
+        posts = {str(post.pk): post for post in self.posts.resolve(context)}
+        engine = context.template.engine
+
+        def fill(match):
+            name, pk = match.groups()
+            if pk not in posts or name not in HOLE_TEMPLATES:
+                return ''
+            with context.push(post=posts[pk]):
+                return engine.get_template(
+                    HOLE_TEMPLATES[name]).render(context)
+
+        return HOLE.sub(fill, html)
+
+
+@register.tag
+def fillholes(parser, token):
+    """Дорисовывает персональные части карточек после чтения кеша.
+
+    {% fillholes page_obj %}...{% endfillholes %}
+    """
+    bits = token.split_contents()
+    if len(bits) != 2:
+        raise template.TemplateSyntaxError(
+            f'{bits[0]} ожидает один аргумент: список постов')
+    nodelist = parser.parse(('endfillholes',))
+    parser.delete_first_token()
+    return FillHolesNode(nodelist, parser.compile_filter(bits[1]))
@@ -0,0 +1,84 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from ..models import Group, Likes, Post, User
+from ..utils import encode_cursor
+
+
+class ApiTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create(username='NoName')
+        cls.group = Group.objects.create(
+            title='Группа', slug='group', description='Описание')
+        cls.posts = [
+            Post.objects.create(text=f'Пост {number}', author=cls.user,
+                                group=cls.group)
+            for number in range(settings.NUMBER_POSTS_ON_FIRST_PAGE + 2)
+        ]
+
+    def setUp(self):
+        cache.clear()
+
+    def test_feeds_paginate_by_cursor(self):
+        """Ленты отдаются страницами по курсору."""
+        for url in (reverse('api_v1:index'),
+                    reverse('api_v1:group_posts', args=('group',)),
+                    reverse('api_v1:profile', args=('NoName',))):
+            with self.subTest(url=url):
+                first = self.client.get(url).json()
+                self.assertEqual(len(first['results']),
+                                 settings.NUMBER_POSTS_ON_FIRST_PAGE)
+                self.assertIsNone(first['previous'])
+                second = self.client.get(first['next']).json()
+                self.assertEqual(
+                    [post['id'] for post in second['results']],
+                    [post.pk for post in self.posts[1::-1]])
+                self.assertIsNone(second['next'])
+                self.assertEqual(second['results'][0]['group'], 'group')
+
+    def test_sparse_fieldsets(self):
+        """?fields= оставляет в ответе только запрошенные поля."""
+        response = self.client.get(
+            reverse('api_v1:post_detail', args=(self.posts[0].pk,)),
+            {'fields': 'id,author,image'})
+        self.assertEqual(response.json(), {
+            'id': self.posts[0].pk, 'author': 'NoName', 'image': None})
+        response = self.client.get(reverse('api_v1:index'),
+                                   {'fields': 'id,password'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_not_modified_until_bump(self):
+        """По ETag отвечается 304, пока данные поста не изменились."""
+        url = reverse('api_v1:post_detail', args=(self.posts[0].pk,))
+        etag = self.client.get(url)['ETag']
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(len(queries), 1)
+
+        Post.objects.filter(pk=self.posts[0].pk).update(likes_count=1)
+        Likes.objects.create(user=self.user, post=self.posts[0])
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(response.json()['likes_count'], 1)
+
+    def test_tampered_cursor(self):
+        """Подделанный курсор API отдаёт первую страницу, а не 500."""
+        response = self.client.get(reverse('api_v1:index'),
+                                   {'after': encode_cursor([{}, 'x'])})
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNone(response.json()['previous'])
+
+    def test_missing_objects(self):
+        """Несуществующие группа и пост дают 404."""
+        self.assertEqual(self.client.get(reverse(
+            'api_v1:group_posts', args=('missing',))).status_code, 404)
+        self.assertEqual(self.client.get(reverse(
+            'api_v1:post_detail', args=(0,))).status_code, 404)
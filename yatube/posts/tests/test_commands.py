@@ -0,0 +1,335 @@
+import gzip
+import json
+import os
+import shutil
+import tempfile
+from io import StringIO
+from unittest import mock
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+from django.core.management import call_command
+from django.db import transaction
+from django.test import override_settings, TestCase
+
+from .. import search, thumbnails
+from ..models import (Comment, Dislikes, Follow, Group, Likes, Post,
+                      TimelineEntry, User)
+
+
+class RebuildTimelinesTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create(username='author')
+        cls.reader = User.objects.create(username='reader')
+        Follow.objects.create(user=cls.reader, author=cls.author)
+        for number in range(3):
+            Post.objects.create(text=f'Пост {number}', author=cls.author)
+
+    def test_timeline_follows_posts_and_subscriptions(self):
+        """Лента подписок пополняется и чистится вместе с подписками."""
+        self.assertEqual(self.reader.timeline.count(), 3)
+        Follow.objects.filter(user=self.reader).delete()
+        self.assertFalse(self.reader.timeline.exists())
+
+    def test_rebuild_timelines(self):
+        """Команда восстанавливает ленты с нуля."""
+        TimelineEntry.objects.all().delete()
+        call_command('rebuild_timelines', batch_size=1, stdout=StringIO())
+        self.assertEqual(
+            set(self.reader.timeline.values_list('post_id', flat=True)),
+            set(Post.objects.values_list('pk', flat=True)))
+
+
+class ReconcileCountersTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create(username='reader')
+        cls.post = Post.objects.create(text='Пост', author=cls.user)
+        Likes.objects.create(user=cls.user, post=cls.post)
+        Dislikes.objects.create(user=cls.user, post=cls.post)
+        Comment.objects.create(author=cls.user, post=cls.post, text='Да')
+
+    def test_reconcile_counters(self):
+        """Команда исправляет разошедшиеся счётчики."""
+        call_command('reconcile_counters', stdout=StringIO())
+        self.post.refresh_from_db()
+        self.assertEqual(
+            (self.post.likes_count, self.post.dislikes_count,
+             self.post.comments_count),
+            (1, 1, 1))
+
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+SMALL_GIF = (
+    b'\x47\x49\x46\x38\x39\x61\x02\x00'
+    b'\x01\x00\x80\x00\x00\x00\x00\x00'
+    b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
+    b'\x00\x00\x00\x2C\x00\x00\x00\x00'
+    b'\x02\x00\x01\x00\x00\x02\x02\x0C'
+    b'\x0A\x00\x3B'
+)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, POST_THUMBNAIL_WORKERS=0)
+class LayoutPostImagesTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create(username='author')
+        FileSystemStorage().save('posts/flat.gif', ContentFile(SMALL_GIF))
+        cls.posts = [
+            Post.objects.create(
+                text=f'Пост {number}', author=cls.user,
+                image='posts/flat.gif')
+            for number in range(2)
+        ]
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def test_layout_post_images(self):
+        """Команда раскладывает плоские картинки по каталогам."""
+        with mock.patch.object(transaction, 'on_commit', lambda func: func()):
+            call_command('layout_post_images', batch_size=1,
+                         stdout=StringIO())
+        names = set(Post.objects.values_list('image', flat=True))
+        self.assertEqual(len(names), 1)
+        name = names.pop()
+        storage = Post._meta.get_field('image').storage
+        self.assertTrue(storage.laid_out(name))
+        self.assertTrue(os.path.exists(storage.path(name)))
+        self.assertFalse(os.path.exists(storage.path('posts/flat.gif')))
+
+        output = StringIO()
+        call_command('layout_post_images', stdout=output)
+        self.assertIn('перенесено постов: 0', output.getvalue())
+
+    @override_settings(POST_IMAGE_LAYOUT='posts.layouts.DateLayout',
+                       POST_IMAGE_LAYOUT_DEPTH=3)
+    def test_date_layout(self):
+        """Раскладка по датам кладёт файл в каталог дня загрузки."""
+        storage = Post._meta.get_field('image').storage
+        name = storage.save('posts/new.gif', ContentFile(SMALL_GIF))
+        self.assertRegex(name, r'^posts/\d{4}/\d\d/\d\d/\w{64}\.gif$')
+        self.assertTrue(storage.laid_out(name))
+        self.assertFalse(storage.laid_out('posts/flat.gif'))
+        digest = '123456' + 'a' * 58
+        self.assertFalse(storage.laid_out(f'posts/12/34/56/{digest}.gif'))
+        self.assertFalse(
+            storage.laid_out(f'posts/2024/13/01/{digest}.gif'))
+        self.assertTrue(storage.laid_out(f'posts/2024/02/29/{digest}.gif'))
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class BackfillImageSizesTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create(username='author')
+        name = FileSystemStorage().save('posts/size.gif',
+                                        ContentFile(SMALL_GIF))
+        cls.post = Post.objects.create(
+            text='С картинкой', author=cls.user, image=name)
+        cls.missing = Post.objects.create(
+            text='Без файла', author=cls.user, image='posts/missing.gif')
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def test_backfill_image_sizes(self):
+        """Команда заполняет размеры и пропускает отсутствующие файлы."""
+        call_command('backfill_image_sizes', stdout=StringIO(),
+                     stderr=StringIO())
+        self.post.refresh_from_db()
+        self.missing.refresh_from_db()
+        self.assertEqual((self.post.image_width, self.post.image_height),
+                         (2, 1))
+        self.assertIsNone(self.missing.image_width)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class RegenerateThumbnailsTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create(username='author')
+        storage = Post._meta.get_field('image').storage
+        cls.post = Post.objects.create(
+            text='С картинкой', author=cls.user,
+            image=storage.save('posts/regen.gif', ContentFile(SMALL_GIF)))
+        cls.progress = os.path.join(TEMP_MEDIA_ROOT, 'progress.json')
+
+    def setUp(self):
+        cache.clear()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def test_regenerate_thumbnails(self):
+        """Команда создаёт все варианты миниатюр и убирает прогресс."""
+        Post.objects.filter(pk=self.post.pk).update(image_webp_savings=999)
+        for workers in (0, 2):
+            with self.subTest(workers=workers):
+                output = StringIO()
+                call_command('regenerate_thumbnails', workers=workers,
+                             progress_file=self.progress, stdout=output)
+                self.assertIn('Готово: 1 картинок', output.getvalue())
+                self.assertFalse(os.path.exists(self.progress))
+                for variant in thumbnails.thumbnail_specs():
+                    thumbnail = thumbnails.ready_thumbnail(
+                        self.post.image, variant)
+                    self.assertTrue(thumbnail.exists())
+                if 'card:webp' not in thumbnails.thumbnail_specs():
+                    self.post.refresh_from_db()
+                    self.assertEqual(self.post.image_webp_savings, 0)
+
+    def test_webp_savings_refreshed(self):
+        """Команда пересчитывает экономию WebP по весу новых миниатюр."""
+        render = thumbnails.render
+
+        def with_webp(name):
+            source_size, made = render(name)
+            card_name, size, weight = made['card']
+            made['card:webp'] = (card_name, size, weight - 100)
+            return source_size, made
+        with mock.patch.object(thumbnails, 'render', with_webp):
+            call_command('regenerate_thumbnails', workers=0,
+                         progress_file=self.progress, stdout=StringIO())
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.image_webp_savings, 100)
+
+    def test_resume_from_progress(self):
+        """Прерванная перегенерация продолжается с сохранённого места."""
+        with open(self.progress, 'w') as progress:
+            progress.write(f'{{"last_id": {self.post.pk}}}')
+        output = StringIO()
+        call_command('regenerate_thumbnails', workers=0,
+                     progress_file=self.progress, stdout=output)
+        self.assertIn('Готово: 0 картинок', output.getvalue())
+        self.assertIsNone(
+            thumbnails.ready_thumbnail(self.post.image, 'card'))
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class ImportPostsTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create(username='author')
+        cls.reader = User.objects.create(username='reader')
+        Follow.objects.create(user=cls.reader, author=cls.author)
+        os.makedirs(TEMP_MEDIA_ROOT, exist_ok=True)
+        with open(os.path.join(TEMP_MEDIA_ROOT, 'import.gif'), 'wb') as gif:
+            gif.write(SMALL_GIF)
+
+    def setUp(self):
+        cache.clear()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def write(self, name, content):
+        path = os.path.join(TEMP_MEDIA_ROOT, name)
+        with open(path, 'w', encoding='utf-8') as file:
+            file.write(content)
+        return path
+
+    def test_deleted_ids_not_reused(self):
+        """Импорт не выдаёт постам id удалённых постов."""
+        deleted = Post.objects.create(text='Удалённый', author=self.author)
+        deleted_id = deleted.pk
+        deleted.delete()
+        path = self.write('reuse.jsonl',
+                          '{"author": "author", "text": "Новый"}')
+        call_command('import_posts', path, stdout=StringIO(),
+                     stderr=StringIO())
+        self.assertGreater(Post.objects.get(text='Новый').pk, deleted_id)
+
+    def test_import_jsonl(self):
+        """Посты из JSONL попадают в ленты и поиск со своими датами."""
+        path = self.write('posts.jsonl', '\n'.join((
+            '{"author": "author", "text": "Старый импорт", '
+            '"pub_date": "2015-03-01T10:00:00", "image": "import.gif"}',
+            '{"author": "newbie", "author_first_name": "Лев", '
+            '"text": "Первый пост", "group": "imported", '
+            '"group_title": "Импорт"}',
+            '{"text": "Без автора"}',
+            'не json',
+            '[1]',
+            '"строка"',
+        )))
+        output, errors = StringIO(), StringIO()
+        call_command('import_posts', path, batch_size=1,
+                     images_dir=TEMP_MEDIA_ROOT, stdout=output,
+                     stderr=errors)
+        self.assertIn('Готово: 2 постов', output.getvalue())
+        self.assertIn('пропущено строк: 4', output.getvalue())
+
+        old = Post.objects.get(text='Старый импорт')
+        self.assertEqual(old.pub_date.year, 2015)
+        self.assertEqual((old.image_width, old.image_height), (2, 1))
+        self.assertTrue(
+            Post._meta.get_field('image').storage.laid_out(old.image.name))
+        self.assertTrue(self.reader.timeline.filter(post=old).exists())
+
+        newbie = User.objects.get(username='newbie')
+        self.assertEqual(newbie.first_name, 'Лев')
+        self.assertFalse(newbie.has_usable_password())
+        group = Group.objects.get(slug='imported')
+        self.assertEqual(group.title, 'Импорт')
+        self.assertTrue(group.posts.filter(author=newbie).exists())
+        if search.enabled():
+            self.assertEqual(
+                list(search.filter_matching(Post.objects.all(), 'Первый')),
+                list(newbie.posts.all()))
+
+    def test_import_csv(self):
+        """CSV загружается пачками, авторы не дублируются."""
+        path = self.write('posts.csv', 'author,text,group\n' + ''.join(
+            f'author,Пост {number},\n' for number in range(5)))
+        call_command('import_posts', path, batch_size=2, stdout=StringIO())
+        self.assertEqual(self.author.posts.count(), 5)
+        self.assertEqual(User.objects.count(), 2)
+        self.assertEqual(self.reader.timeline.count(), 5)
+
+
+class ExportPostsTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create(username='author')
+        cls.posts = [
+            Post.objects.create(text=f'Пост {number}', author=cls.user)
+            for number in range(3)
+        ]
+        cls.output = os.path.join(TEMP_MEDIA_ROOT, 'posts.jsonl.gz')
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def test_export_posts(self):
+        """Команда выгружает посты после водяного знака и сообщает новый."""
+        os.makedirs(TEMP_MEDIA_ROOT, exist_ok=True)
+        errors = StringIO()
+        call_command('export_posts', since_id=self.posts[0].pk, gzip=True,
+                     output=self.output, stderr=errors)
+        with gzip.open(self.output, 'rt', encoding='utf-8') as exported:
+            records = [json.loads(line) for line in exported]
+        self.assertEqual([record['text'] for record in records],
+                         ['Пост 1', 'Пост 2'])
+        self.assertIn(f'последний id: {self.posts[-1].pk}', errors.getvalue())
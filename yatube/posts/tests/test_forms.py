@@ -1,11 +1,18 @@
+import io
+import os
 import shutil
 import tempfile
+from unittest import mock
 
 from django.test import Client, override_settings, TestCase
 from django.urls import reverse
 from django.conf import settings
+from django.core.cache import cache
 from django.core.files.uploadedfile import SimpleUploadedFile
 
+from PIL import Image
+
+from .. import images
 from ..models import Comment, Group, Post, User
 
 TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
@@ -35,7 +42,7 @@ class PostFormTest(TestCase):
             group=cls.group
         )
 
-        small_gif = (
+        cls.small_gif = small_gif = (
             b'\x47\x49\x46\x38\x39\x61\x02\x00'
             b'\x01\x00\x80\x00\x00\x00\x00\x00'
             b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
@@ -61,7 +68,8 @@ class PostFormTest(TestCase):
         shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
 
     def setUp(self):
-
+        # Занятость файлов картинок хранится в кеше.
+        cache.clear()
         self.authorized_client = Client()
         self.authorized_client.force_login(self.user)
 
@@ -82,10 +90,114 @@ class PostFormTest(TestCase):
         post = Post.objects.select_related('group', 'author').get(pk=id_post)
         self.assertEqual(self.post_text_form['text'], post.text)
         self.assertEqual(self.post_text_form['group'], post.group.pk)
-        self.assertEqual(f'posts/{self.post_text_form["image"]}', post.image)
+        self.assertRegex(post.image.name, r'^posts/\w\w/\w\w/\w{64}\.jpg$')
         self.assertEqual(self.user, post.author)
         self.assertEqual(response.status_code, 200)
 
+    def test_uploaded_image_is_normalized(self):
+        """Картинка уменьшается и пересохраняется без EXIF"""
+        side = settings.POST_IMAGE_MAX_SIDE
+        buffer = io.BytesIO()
+        exif = Image.Exif()
+        exif[0x010F] = 'Camera'
+        Image.new('RGB', (side * 3, side)).save(
+            buffer, 'JPEG', exif=exif.tobytes())
+        uploaded = SimpleUploadedFile(
+            'photo.jpeg', buffer.getvalue(), content_type='image/jpeg')
+
+        self.authorized_client.post(
+            reverse('posts:post_create'),
+            data={'text': 'Фото', 'image': uploaded})
+
+        post = Post.objects.get(text='Фото')
+        self.assertTrue(post.image.name.endswith('.jpg'))
+        with Image.open(post.image.path) as image:
+            self.assertEqual(image.size, (side, side // 3))
+            self.assertTrue(image.info.get('progressive'))
+            self.assertFalse(image.getexif())
+        self.assertEqual((post.image_width, post.image_height),
+                         (side, side // 3))
+
+    def test_same_image_is_stored_once(self):
+        """Одинаковые картинки хранятся в одном файле до удаления постов"""
+        texts = ('Мем', 'Тот же мем')
+        with mock.patch.object(
+                images.transaction, 'on_commit', lambda func: func()):
+            for text in texts:
+                self.authorized_client.post(
+                    reverse('posts:post_create'),
+                    data={'text': text, 'image': SimpleUploadedFile(
+                        'meme.gif', self.small_gif,
+                        content_type='image/gif')})
+            first, second = Post.objects.filter(text__in=texts)
+            self.assertEqual(first.image.name, second.image.name)
+            path = first.image.path
+
+            first.delete()
+            self.assertTrue(os.path.exists(path))
+            second.delete()
+        self.assertFalse(os.path.exists(path))
+
+    def test_uncommitted_upload_keeps_image(self):
+        """Файл не удаляется, пока загрузка с ним не закоммичена"""
+        with mock.patch.object(
+                images.transaction, 'on_commit', lambda func: func()):
+            self.authorized_client.post(
+                reverse('posts:post_create'),
+                data={'text': 'Мем', 'image': SimpleUploadedFile(
+                    'meme.gif', self.small_gif, content_type='image/gif')})
+            post = Post.objects.get(text='Мем')
+            storage = post.image.storage
+            # Та же картинка загружается заново, но пост ещё не сохранён.
+            name = storage.save('posts/meme.jpg', post.image.file)
+            self.assertEqual(name, post.image.name)
+            post.delete()
+            self.assertTrue(storage.exists(name))
+            storage.unclaim(name)
+            images.release(name)
+        self.assertFalse(storage.exists(name))
+
+    def upload_picture(self, text, image, quality=90):
+        buffer = io.BytesIO()
+        image.save(buffer, 'JPEG', quality=quality)
+        self.authorized_client.post(
+            reverse('posts:post_create'),
+            data={'text': text, 'image': SimpleUploadedFile(
+                f'{len(text)}.jpg', buffer.getvalue(),
+                content_type='image/jpeg')})
+        return Post.objects.get(text=text)
+
+    def test_near_duplicates_are_flagged(self):
+        """Пережатая и обрезанная копия картинки помечается дубликатом"""
+        picture = Image.effect_mandelbrot(
+            (300, 200), (-2, -1, 1, 1), 50).convert('RGB')
+        original = self.upload_picture('Оригинал', picture)
+        copy = self.upload_picture(
+            'Копия', picture.crop((3, 2, 297, 198)), quality=30)
+        other = self.upload_picture(
+            'Другая', picture.transpose(Image.FLIP_LEFT_RIGHT))
+
+        self.assertIsNone(original.duplicate_of)
+        self.assertEqual(copy.duplicate_of, original)
+        self.assertIsNone(other.duplicate_of)
+
+        admin = User.objects.create_superuser('admin', 'a@a.ru', 'pass')
+        self.client.force_login(admin)
+        response = self.client.get(
+            reverse('admin:posts_duplicatecluster_changelist'))
+        self.assertEqual(list(response.context['cl'].result_list),
+                         [original])
+
+    def test_not_image_is_rejected(self):
+        """Файл, который не является картинкой, не принимается"""
+        uploaded = SimpleUploadedFile(
+            'fake.jpg', b'not an image', content_type='image/jpeg')
+        response = self.authorized_client.post(
+            reverse('posts:post_create'),
+            data={'text': 'Не картинка', 'image': uploaded})
+        self.assertTrue(response.context['form'].errors['image'])
+        self.assertFalse(Post.objects.filter(text='Не картинка').exists())
+
     def test_create_post_by_guest(self):
         """Работа формы не зарегистрирванного пользователя"""
 
@@ -0,0 +1,71 @@
+import re
+from unittest import skipUnless
+
+from django.core.cache import cache
+from django.db import connection
+from django.test import Client, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from ..models import Comment, Follow, Group, Likes, Post, User
+
+# Полный проход по таблице без индекса или сортировка во временном дереве.
+BAD_PLAN = re.compile(r'^SCAN (?!.*\bINDEX\b)|TEMP B-TREE')
+
+
+@skipUnless(connection.vendor == 'sqlite', 'EXPLAIN QUERY PLAN есть в SQLite')
+class FeedQueryPlanTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create(username='author')
+        cls.reader = User.objects.create(username='reader')
+        cls.group = Group.objects.create(
+            title='Группа', slug='group', description='Описание')
+        posts = [
+            Post.objects.create(text=f'Пост {number}', author=cls.author,
+                                group=cls.group)
+            for number in range(25)
+        ]
+        Comment.objects.create(post=posts[0], author=cls.reader, text='Да')
+        Likes.objects.create(post=posts[-1], user=cls.reader)
+        Follow.objects.create(user=cls.reader, author=cls.author)
+
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.client.force_login(self.reader)
+
+    def bad_plans(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        bad = []
+        with connection.cursor() as cursor:
+            for query in queries.captured_queries:
+                if not query['sql'].startswith('SELECT'):
+                    continue
+                cursor.execute('EXPLAIN QUERY PLAN ' + query['sql'])
+                details = [row[-1] for row in cursor.fetchall()]
+                if any(BAD_PLAN.search(detail) for detail in details):
+                    bad.append((query['sql'], details))
+        return response, bad
+
+    def test_feed_queries_use_indexes(self):
+        """Запросы лент не сканируют таблицы и не сортируют без индекса."""
+        urls = [
+            reverse('posts:index'),
+            reverse('posts:group_list', args=('group',)),
+            reverse('posts:profile', args=('author',)),
+            reverse('posts:follow_index'),
+            reverse('posts:post_detail',
+                    args=(Post.objects.order_by('pk')[0].pk,)),
+        ]
+        for url in urls:
+            with self.subTest(url=url):
+                response, bad = self.bad_plans(url)
+                self.assertEqual(bad, [])
+                page_obj = response.context.get('page_obj')
+                if page_obj is not None and page_obj.has_next():
+                    next_page = f'{url}?after={page_obj.paginator.next_cursor}'
+                    self.assertEqual(self.bad_plans(next_page)[1], [])
@@ -1,3 +1,4 @@
+from django.core.cache import cache
 from django.test import TestCase, Client
 from django.urls import reverse
 
@@ -27,6 +28,7 @@ class PostURLTests(TestCase):
                                 kwargs={'post_id': cls.post.id})
 
     def setUp(self):
+        cache.clear()
 
         self.authorized_client = Client()
         self.authorized_client.force_login(self.test_author)
@@ -1,16 +1,41 @@
+import gzip
+import io
+import json
+import os
 import tempfile
+import time
 import shutil
+import zipfile
+from unittest import mock
 
 from django.test import Client, override_settings, TestCase
 from django.urls import reverse
+from django.utils.http import http_date
 from django import forms
 from django.conf import settings
+from django.core.files.base import ContentFile
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.core.cache import cache
+from django.db import connection
+from django.template import Context, Template
+from django.test.utils import CaptureQueriesContext
+from PIL import features
+from sorl.thumbnail.images import ImageFile
 
-from ..models import Comment, Follow, Group, Post, User
+from .. import archive as archive_module
+from .. import caching, thumbnails
+from ..models import Comment, Follow, Group, Likes, Post, User
+from ..utils import encode_cursor
 
 TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+SMALL_GIF = (
+    b'\x47\x49\x46\x38\x39\x61\x02\x00'
+    b'\x01\x00\x80\x00\x00\x00\x00\x00'
+    b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
+    b'\x00\x00\x00\x2C\x00\x00\x00\x00'
+    b'\x02\x00\x01\x00\x00\x02\x02\x0C'
+    b'\x0A\x00\x3B'
+)
 
 
 @override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
@@ -64,6 +89,7 @@ class TaskPagesTests(TestCase):
         self.assertEqual(page_obj.image, self.post.image)
 
     def setUp(self):
+        cache.clear()
 
         self.authorized_client = Client()
         self.authorized_client.force_login(self.user)
@@ -229,15 +255,39 @@ class TaskPagesTests(TestCase):
     def test_index_cache(self):
         """Тест кэша"""
         cache_content = self.client.get(reverse('posts:index')).content
-        Post.objects.create(
-            text='Текст для проверки кэша',
-            author=self.user
-        )
-        cache_before_20sec = self.client.get(reverse('posts:index')).content
-        self.assertEqual(cache_content, cache_before_20sec)
+        Post.objects.filter(pk=self.post.pk).update(
+            text='Изменение в обход сигналов')
+        cached = self.client.get(reverse('posts:index')).content
+        self.assertEqual(cache_content, cached)
         cache.clear()
-        cache_after_20sec = self.client.get(reverse('posts:index')).content
-        self.assertNotEqual(cache_content, cache_after_20sec)
+        after_clear = self.client.get(reverse('posts:index')).content
+        self.assertNotEqual(cache_content, after_clear)
+
+    def test_feed_cache_invalidation(self):
+        """Кэш лент сбрасывается при записи в связанные таблицы."""
+        Follow.objects.create(user=self.another_user, author=self.user)
+        feeds = (reverse('posts:index'),
+                 reverse('posts:group_list',
+                         kwargs={'slug_name': self.group.slug}),
+                 reverse('posts:profile',
+                         kwargs={'username': self.user.username}),
+                 reverse('posts:follow_index'))
+        writes = (
+            lambda: Post.objects.create(
+                text='Новый пост', author=self.user, group=self.group),
+            lambda: Likes.objects.create(
+                user=self.another_user, post=self.post),
+            lambda: Post.objects.filter(text='Новый пост').delete(),
+        )
+        for write in writes:
+            before = [self.another.get(address).content
+                      for address in feeds]
+            write()
+            after = [self.another.get(address).content
+                     for address in feeds]
+            for address, old, new in zip(feeds, before, after):
+                with self.subTest(address=address):
+                    self.assertNotEqual(old, new)
 
     def test_authorized_user_follow(self):
         """Авториз. пользователь может подписаться на автора"""
@@ -280,6 +330,30 @@ class TaskPagesTests(TestCase):
         self.assertEqual(post,
                          response.context['page_obj'][settings.FIRST_OBJECT])
 
+    def test_follow_feed_reads_generations_first(self):
+        """Поколения авторов ленты подписок читаются до запроса страницы."""
+        Follow.objects.create(user=self.user, author=self.another_user)
+        Post.objects.create(text='пост для подписчика',
+                            author=self.another_user)
+        events = []
+        generation = caching.generation
+
+        def record_generation(*scopes):
+            events.append(scopes)
+            return generation(*scopes)
+
+        def record_query(execute, sql, params, many, context):
+            if 'posts_timelineentry' in sql:
+                events.append('feed')
+            return execute(sql, params, many, context)
+
+        with mock.patch.object(caching, 'generation', record_generation), \
+                connection.execute_wrapper(record_query):
+            self.authorized_client.get(reverse('posts:follow_index'))
+        last_feed = len(events) - events[::-1].index('feed') - 1
+        self.assertIn(caching.author_scope(self.another_user.pk),
+                      events[last_feed - 1])
+
     def test_new_post_not_follower(self):
         """Пост не появляется в ленте не подписчика"""
         self.authorized_client.get(
@@ -294,6 +368,158 @@ class TaskPagesTests(TestCase):
             reverse('posts:follow_index'))
         self.assertNotIn(post, response.context['page_obj'])
 
+    def test_reaction_counters(self):
+        """Лайк и дизлайк меняют счётчики поста."""
+        like = reverse('posts:add_like', kwargs={'post_id': self.post.id})
+        dislike = reverse('posts:add_dislike',
+                          kwargs={'post_id': self.post.id})
+        self.another.get(like, HTTP_REFERER='/')
+        self.another.get(like, HTTP_REFERER='/')
+        self.post.refresh_from_db()
+        self.assertEqual((self.post.likes_count, self.post.dislikes_count),
+                         (1, 0))
+        self.another.get(dislike, HTTP_REFERER='/')
+        self.post.refresh_from_db()
+        self.assertEqual((self.post.likes_count, self.post.dislikes_count),
+                         (0, 1))
+
+    def test_drifted_counter_does_not_go_negative(self):
+        """Неучтённый лайк не роняет дизлайк и не уводит счётчик ниже 0."""
+        Likes.objects.create(user=self.another_user, post=self.post)
+        dislike = reverse('posts:add_dislike',
+                          kwargs={'post_id': self.post.id})
+        response = self.another.get(dislike, HTTP_REFERER='/')
+        self.assertEqual(response.status_code, 302)
+        self.post.refresh_from_db()
+        self.assertEqual((self.post.likes_count, self.post.dislikes_count),
+                         (0, 1))
+
+    def test_viewer_reactions(self):
+        """Лента знает, какие посты лайкнул текущий пользователь."""
+        Likes.objects.create(user=self.another_user, post=self.post)
+        address = reverse('posts:group_list',
+                          kwargs={'slug_name': self.group.slug})
+        liked = self.another.get(address).context['page_obj'][0]
+        not_liked = self.authorized_client.get(address).context['page_obj'][0]
+        self.assertTrue(liked.viewer_liked)
+        self.assertFalse(liked.viewer_disliked)
+        self.assertFalse(not_liked.viewer_liked)
+
+    def test_cached_feed_is_personal(self):
+        """Общий кэш ленты не прячет персональные кнопки."""
+        like_url = reverse('posts:add_like', kwargs={'post_id': self.post.id})
+        edit_url = reverse('posts:post_edit', kwargs={'post_id': self.post.id})
+        anonymous = self.client.get(reverse('posts:index')).content.decode()
+        author = self.authorized_client.get(
+            reverse('posts:index')).content.decode()
+        reader = self.another.get(reverse('posts:index')).content.decode()
+        self.assertNotIn(like_url, anonymous)
+        self.assertIn(like_url, author)
+        self.assertIn(edit_url, author)
+        self.assertIn(like_url, reader)
+        self.assertNotIn(edit_url, reader)
+        self.assertNotIn('<!--hole:', reader)
+
+    def test_anonymous_page_cache(self):
+        """Анонимные страницы отдаются из кэша до изменения данных."""
+        address = reverse('posts:post_detail',
+                          kwargs={'post_id': self.post.id})
+        response = self.client.get(address)
+        self.assertIn('public', response['Cache-Control'])
+        self.assertIn(f'post:{self.post.id}', response['Surrogate-Key'])
+        self.assertIsNone(self.client.get(address).context)
+        Comment.objects.create(
+            post=self.post, author=self.user, text='Новый комментарий')
+        response = self.client.get(address)
+        self.assertIsNotNone(response.context)
+        self.assertContains(response, 'Новый комментарий')
+        response = self.authorized_client.get(address)
+        self.assertIn('private', response['Cache-Control'])
+        self.assertIsNotNone(response.context)
+
+    def test_thumbnails_generated_off_request(self):
+        """Пока миниатюра не готова, страница показывает оригинал."""
+        address = reverse('posts:post_detail',
+                          kwargs={'post_id': self.post.id})
+        self.assertContains(self.client.get(address), self.post.image.url)
+        self.assertIsNone(thumbnails.ready_thumbnail(self.post.image, 'card'))
+        thumbnails.generate(self.post.id)
+        thumbnail = thumbnails.ready_thumbnail(self.post.image, 'card')
+        self.assertIsNotNone(thumbnail)
+        response = self.client.get(address)
+        self.assertContains(response, f'src="{thumbnail.url}"')
+        self.assertContains(response, f'{thumbnail.url} 960w')
+        self.assertContains(response, 'width="960" height="339"')
+        self.assertContains(response, 'loading="lazy"')
+
+    def test_thumbnails_prefetched_per_page(self):
+        """Миниатюры страницы ищутся одним пакетом."""
+        Post.objects.bulk_create(
+            Post(text=f'Пост {number}', author=self.user,
+                 image=f'posts/missing{number}.gif')
+            for number in range(5))
+        thumbnails.generate(self.post.id)
+        posts = list(Post.objects.exclude(image=''))
+        thumbnails.stats.clear()
+        with self.assertNumQueries(1):
+            thumbnails.prefetch(posts)
+        with self.assertNumQueries(0):
+            thumbnails.prefetch(posts)
+        lookups = len(posts) * len(settings.POST_THUMBNAILS)
+        self.assertEqual(thumbnails.stats['lookups'], 2 * lookups)
+        # Готовые миниатюры generate() уже положил в кеш.
+        self.assertEqual(thumbnails.stats['cache_hits'],
+                         lookups + len(settings.POST_THUMBNAILS))
+        self.assertEqual(thumbnails.stats['db_queries'], 1)
+        ready = {post.pk: post.ready_thumbnails['card'] for post in posts}
+        self.assertIsNotNone(ready.pop(self.post.id))
+        self.assertEqual(set(ready.values()), {None})
+        thumbnail = thumbnails.ready_thumbnail(self.post.image, 'card')
+        self.assertContains(
+            self.client.get(reverse('posts:index')), thumbnail.url)
+
+    def test_webp_variants(self):
+        """WebP-копии создаются, только если Pillow умеет WebP."""
+        with mock.patch.object(features, 'check', return_value=True):
+            specs = thumbnails.thumbnail_specs()
+            with self.settings(POST_THUMBNAIL_WEBP=False):
+                self.assertNotIn('card:webp', thumbnails.thumbnail_specs())
+        self.assertEqual(specs['card:webp'][1]['format'], 'WEBP')
+        with mock.patch.object(features, 'check', return_value=False):
+            self.assertNotIn('card:webp', thumbnails.thumbnail_specs())
+
+    def test_webp_picture(self):
+        """Готовые WebP-копии выводятся через <picture>."""
+        ready = {}
+        for variant, width in (('card', 960), ('card_480', 480)):
+            for suffix, extension in (('', 'jpg'), (':webp', 'webp')):
+                image = ImageFile(f'cache/{variant}.{extension}')
+                image.set_size((width, width // 3))
+                ready[variant + suffix] = image
+        self.post.ready_thumbnails = ready
+        html = Template('{% load post_images %}{% post_image post %}').render(
+            Context({'post': self.post}))
+        self.assertIn('<picture>', html)
+        self.assertIn(f'{ready["card_480:webp"].url} 480w', html)
+        self.assertIn(f'src="{ready["card"].url}"', html)
+
+    def test_webp_savings_reported(self):
+        """Лента сообщает, сколько байт сэкономил WebP."""
+        Post.objects.filter(pk=self.post.pk).update(image_webp_savings=1234)
+        before = thumbnails.stats['webp_bytes_saved']
+        response = self.client.get(
+            reverse('posts:index'), HTTP_ACCEPT='image/webp,*/*')
+        self.assertEqual(response['X-WebP-Bytes-Saved'], '1234')
+        self.assertIn('Accept', response['Vary'])
+        # Страница уже в кеше, но заголовок зависит от Accept запроса.
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('posts:index'))
+        self.assertNotIn('X-WebP-Bytes-Saved', response)
+        response = self.client.get(
+            reverse('posts:index'), HTTP_ACCEPT='image/webp')
+        self.assertEqual(response['X-WebP-Bytes-Saved'], '1234')
+        self.assertEqual(thumbnails.stats['webp_bytes_saved'] - before, 2468)
+
 
 class PaginatorViewTest(TestCase):
     @classmethod
@@ -316,6 +542,7 @@ class PaginatorViewTest(TestCase):
             )
 
     def setUp(self):
+        cache.clear()
         self.authorized_client = Client()
         self.authorized_client.force_login(self.user)
 
@@ -323,12 +550,368 @@ class PaginatorViewTest(TestCase):
         """Проверка корректной работы paginator."""
         list_of_check_page = ['/', f'/group/{self.group.slug}/',
                               f'/profile/{self.user}/']
-        list_of_paginator_page = [('?page=1',
-                                   settings.NUMBER_POSTS_ON_FIRST_PAGE),
-                                  ('?page=2',
-                                   settings.NUMBER_POSTS_ON_SECOND_PAGE)]
         for page in list_of_check_page:
-            for pag in list_of_paginator_page:
-                with self.subTest(adress=pag):
-                    response = self.client.get(page + pag[0])
-                    self.assertEqual(len(response.context['page_obj']), pag[1])
+            with self.subTest(adress=page):
+                response = self.client.get(page)
+                page_obj = response.context['page_obj']
+                self.assertEqual(len(page_obj),
+                                 settings.NUMBER_POSTS_ON_FIRST_PAGE)
+                self.assertFalse(page_obj.has_previous())
+
+                response = self.client.get(
+                    page, {'after': page_obj.paginator.next_cursor})
+                second_page = response.context['page_obj']
+                self.assertEqual(len(second_page),
+                                 settings.NUMBER_POSTS_ON_SECOND_PAGE)
+                self.assertFalse(second_page.has_next())
+                self.assertNotIn(page_obj[settings.FIRST_OBJECT],
+                                 second_page.object_list)
+
+                response = self.client.get(
+                    page, {'before': second_page.paginator.previous_cursor})
+                self.assertEqual(list(response.context['page_obj']),
+                                 list(page_obj))
+
+    def test_paginator_broken_cursor(self):
+        """Испорченный курсор открывает первую страницу."""
+        response = self.client.get('/', {'after': 'not-a-cursor'})
+        self.assertEqual(len(response.context['page_obj']),
+                         settings.NUMBER_POSTS_ON_FIRST_PAGE)
+
+    def test_paginator_tampered_cursor(self):
+        """Подделанные значения курсора тоже открывают первую страницу."""
+        for values in (['garbage', 1], [None, None], [{}, 'x'],
+                       ['2020-01-01T00:00:00', 1.5]):
+            with self.subTest(values=values):
+                response = self.client.get(
+                    '/', {'before': encode_cursor(values)})
+                self.assertEqual(len(response.context['page_obj']),
+                                 settings.NUMBER_POSTS_ON_FIRST_PAGE)
+
+    def test_feed_query_count(self):
+        """Число запросов ленты не зависит от числа постов на странице."""
+        Follow.objects.create(user=self.user, author=self.user)
+        feeds = [reverse('posts:index'),
+                 reverse('posts:group_list',
+                         kwargs={'slug_name': self.group.slug}),
+                 reverse('posts:profile',
+                         kwargs={'username': self.user.username}),
+                 reverse('posts:follow_index')]
+        for address in feeds:
+            with self.subTest(address=address):
+                Post.objects.exclude(pk=Post.objects.first().pk).delete()
+                cache.clear()
+                with CaptureQueriesContext(connection) as one_post:
+                    self.authorized_client.get(address)
+                for _ in range(settings.NUMBER_OF_POSTS):
+                    Post.objects.create(
+                        text='Ещё пост', author=self.user, group=self.group)
+                cache.clear()
+                with CaptureQueriesContext(connection) as full_page:
+                    self.authorized_client.get(address)
+                self.assertEqual(len(one_post), len(full_page))
+
+
+class SearchViewTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create(username='NoName')
+        cls.best = Post.objects.create(
+            text='котики котики котики', author=cls.user)
+        cls.other = Post.objects.create(
+            text='<b>котики</b> и собаки', author=cls.user)
+        Post.objects.create(text='только собаки', author=cls.user)
+        for number in range(settings.NUMBER_OF_POSTS):
+            Post.objects.create(text=f'Котики №{number}', author=cls.user)
+
+    def test_search_ranks_and_highlights(self):
+        """Поиск находит посты по словам и подсвечивает совпадения."""
+        response = self.client.get(reverse('posts:search'), {'q': 'КОТИКИ'})
+        page_obj = response.context['page_obj']
+        self.assertEqual(page_obj[settings.FIRST_OBJECT], self.best)
+        self.assertIn('<mark>котики</mark>', page_obj[0].snippet)
+
+        response = self.client.get(
+            reverse('posts:search'),
+            {'q': 'котики', 'after': page_obj.paginator.next_cursor})
+        second_page = response.context['page_obj']
+        found = set(page_obj.object_list) | set(second_page.object_list)
+        self.assertEqual(len(found), settings.NUMBER_OF_POSTS + 2)
+        self.assertFalse(second_page.has_next())
+
+    def test_search_escapes_snippets(self):
+        """Разметка из текста поста не попадает в сниппет как HTML."""
+        response = self.client.get(reverse('posts:search'), {'q': 'собаки'})
+        self.assertContains(response, '&lt;b&gt;')
+        self.assertNotContains(response, '<b>котики</b>')
+
+    def test_search_follows_edits(self):
+        """Индекс обновляется при изменении и удалении постов."""
+        self.other.text = 'только хомяки'
+        self.other.save()
+        response = self.client.get(reverse('posts:search'), {'q': 'хомяки'})
+        self.assertEqual(list(response.context['page_obj']), [self.other])
+        self.other.delete()
+        response = self.client.get(reverse('posts:search'), {'q': 'хомяки'})
+        self.assertEqual(len(response.context['page_obj']), 0)
+
+    def test_search_syntax_is_not_interpreted(self):
+        """Операторы FTS в запросе не ломают поиск."""
+        response = self.client.get(reverse('posts:search'),
+                                   {'q': 'котики" OR NEAR('})
+        self.assertEqual(response.status_code, 200)
+
+    def test_admin_search_uses_index(self):
+        """Поиск в админке идёт по тому же индексу."""
+        admin = User.objects.create_superuser(
+            'admin', 'admin@example.com', 'password')
+        client = Client()
+        client.force_login(admin)
+        response = client.get(reverse('admin:posts_post_changelist'),
+                              {'q': 'собаки'})
+        self.assertEqual(set(response.context['cl'].result_list),
+                         {self.other, Post.objects.get(text='только собаки')})
+
+
+class ExportViewTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create(username='NoName')
+        cls.posts = [
+            Post.objects.create(text=f'Пост {number}', author=cls.user)
+            for number in range(3)
+        ]
+        Comment.objects.create(post=cls.posts[0], author=cls.user,
+                               text='Комментарий')
+        cls.staff = User.objects.create(username='staff', is_staff=True)
+
+    def setUp(self):
+        self.staff_client = Client()
+        self.staff_client.force_login(self.staff)
+
+    def test_export_is_staff_only(self):
+        """Выгрузка недоступна обычным пользователям."""
+        client = Client()
+        client.force_login(self.user)
+        response = client.get(reverse('posts:export', args=('posts',)))
+        self.assertEqual(response.status_code, 302)
+
+    def test_export_streams_since_watermark(self):
+        """Выгрузка отдаётся потоком и начинается после водяного знака."""
+        response = self.staff_client.get(
+            reverse('posts:export', args=('posts',)),
+            {'since_id': self.posts[0].pk})
+        self.assertTrue(response.streaming)
+        records = [json.loads(line) for line in b''.join(
+            response.streaming_content).decode().splitlines()]
+        self.assertEqual([record['id'] for record in records],
+                         [post.pk for post in self.posts[1:]])
+        self.assertEqual(records[0]['author__username'], 'NoName')
+
+    def test_export_gzip_csv(self):
+        """CSV комментариев сжимается на лету."""
+        response = self.staff_client.get(
+            reverse('posts:export', args=('comments',)),
+            {'format': 'csv', 'gzip': '1'})
+        self.assertEqual(response['Content-Type'], 'application/gzip')
+        lines = gzip.decompress(
+            b''.join(response.streaming_content)).decode().splitlines()
+        self.assertEqual(lines[0], 'id,created,post_id,author__username,text')
+        self.assertEqual(len(lines), 2)
+
+    def test_export_rejects_bad_parameters(self):
+        """Неизвестные таблица, формат и водяной знак отклоняются."""
+        url = reverse('posts:export', args=('posts',))
+        self.assertEqual(self.staff_client.get(
+            reverse('posts:export', args=('users',))).status_code, 404)
+        self.assertEqual(self.staff_client.get(
+            url, {'format': 'xml'}).status_code, 400)
+        self.assertEqual(self.staff_client.get(
+            url, {'since': 'вчера'}).status_code, 400)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT,
+                   ARCHIVE_ROOT=os.path.join(TEMP_MEDIA_ROOT, 'archives'),
+                   ARCHIVE_WORKERS=0)
+class DataArchiveViewTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create(username='NoName')
+        cls.author = User.objects.create(username='Author')
+        storage = Post._meta.get_field('image').storage
+        cls.image = storage.save('posts/archive.gif',
+                                 ContentFile(SMALL_GIF))
+        cls.post = Post.objects.create(
+            text='Пост с картинкой', author=cls.user, image=cls.image)
+        Post.objects.create(text='Чужой пост', author=cls.author)
+        Comment.objects.create(post=cls.post, author=cls.user, text='Мой')
+        Likes.objects.create(post=cls.post, user=cls.user)
+        Follow.objects.create(user=cls.user, author=cls.author)
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.user)
+
+    def read(self, response):
+        content = b''.join(response.streaming_content)
+        return zipfile.ZipFile(io.BytesIO(content))
+
+    def test_profile_links_archive(self):
+        """Ссылка на архив видна только владельцу профиля."""
+        url = reverse('posts:data_archive')
+        response = self.authorized_client.get(
+            reverse('posts:profile', args=(self.user.username,)))
+        self.assertContains(response, url)
+        response = self.authorized_client.get(
+            reverse('posts:profile', args=(self.author.username,)))
+        self.assertNotContains(response, url)
+
+    def test_archive_streams_user_data(self):
+        """Небольшой архив отдаётся потоком со всеми данными."""
+        response = self.authorized_client.get(reverse('posts:data_archive'))
+        self.assertTrue(response.streaming)
+        archive = self.read(response)
+        self.assertIsNone(archive.testzip())
+        posts = [json.loads(line) for line in
+                 archive.read('posts.jsonl').decode().splitlines()]
+        self.assertEqual([post['id'] for post in posts], [self.post.pk])
+        self.assertEqual(archive.read(self.image), SMALL_GIF)
+        self.assertEqual(json.loads(archive.read('follows.jsonl')),
+                         {'author__username': 'Author'})
+        self.assertIn(b'"post_id"', archive.read('likes.jsonl'))
+
+    @override_settings(ARCHIVE_INLINE_MAX_ITEMS=1)
+    def test_large_archive_built_in_background(self):
+        """Большой архив собирается в фоне и потом скачивается файлом."""
+        response = self.authorized_client.get(reverse('posts:data_archive'))
+        self.assertTemplateUsed(response, 'posts/archive_pending.html')
+        response = self.authorized_client.get(reverse('posts:data_archive'))
+        self.assertIn('yatube-NoName.zip', response['Content-Disposition'])
+        archive = self.read(response)
+        self.assertIn('comments.jsonl', archive.namelist())
+
+    @override_settings(ARCHIVE_INLINE_MAX_BYTES=len(SMALL_GIF) - 1)
+    def test_heavy_images_make_archive_large(self):
+        """Архив с тяжёлыми картинками тоже собирается в фоне."""
+        response = self.authorized_client.get(reverse('posts:data_archive'))
+        self.assertTemplateUsed(response, 'posts/archive_pending.html')
+
+    @override_settings(ARCHIVE_INLINE_MAX_ITEMS=1)
+    def test_archive_outdated_by_new_data(self):
+        """Новые данные пересобирают архив, а старый удаляется."""
+        self.authorized_client.get(reverse('posts:data_archive'))
+        Comment.objects.create(post=self.post, author=self.user,
+                               text='Ещё один')
+        response = self.authorized_client.get(reverse('posts:data_archive'))
+        self.assertTemplateUsed(response, 'posts/archive_pending.html')
+        self.assertEqual(len(os.listdir(settings.ARCHIVE_ROOT)), 1)
+        response = self.authorized_client.get(reverse('posts:data_archive'))
+        comments = self.read(response).read('comments.jsonl').decode()
+        self.assertIn('Ещё один', comments)
+
+    @override_settings(ARCHIVE_INLINE_MAX_ITEMS=1)
+    def test_expired_archive_purged(self):
+        """Просроченные архивы удаляются."""
+        self.authorized_client.get(reverse('posts:data_archive'))
+        name = archive_module.ready(self.user.pk)
+        old = time.time() - settings.ARCHIVE_MAX_AGE - 1
+        os.utime(name, (old, old))
+        self.assertIsNone(archive_module.ready(self.user.pk))
+        archive_module.purge()
+        self.assertFalse(os.path.exists(name))
+
+
+class ConditionalGetTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create(username='NoName')
+        cls.reader = User.objects.create(username='Reader')
+        cls.group = Group.objects.create(
+            title='Группа', slug='group', description='Описание')
+        cls.post = Post.objects.create(
+            text='Пост', author=cls.user, group=cls.group)
+
+    def setUp(self):
+        cache.clear()
+
+    def backdate(self):
+        # Last-Modified ставится, только когда секунда сброса прошла.
+        with mock.patch('time.time', return_value=time.time() - 2):
+            caching.bump_post(self.post.pk)
+
+    def test_unchanged_pages_not_modified(self):
+        """Неизменившиеся страницы отвечают 304 без запросов ленты."""
+        self.backdate()
+        for url in (reverse('posts:post_detail', args=(self.post.pk,)),
+                    reverse('posts:profile', args=('NoName',)),
+                    reverse('posts:group_list', args=('group',))):
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                with CaptureQueriesContext(connection) as queries:
+                    cached = self.client.get(
+                        url, HTTP_IF_NONE_MATCH=response['ETag'])
+                self.assertEqual(cached.status_code, 304)
+                self.assertEqual(cached['ETag'], response['ETag'])
+                self.assertLessEqual(len(queries), 1)
+                cached = self.client.get(
+                    url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+                self.assertEqual(cached.status_code, 304)
+
+    def test_change_in_same_second_not_hidden(self):
+        """Сброс в ту же секунду не даёт 304 по If-Modified-Since."""
+        url = reverse('posts:profile', args=('NoName',))
+        now = time.time()
+        with mock.patch('time.time', return_value=now):
+            self.assertNotIn('Last-Modified', self.client.get(url))
+            Post.objects.create(text='Свежий пост', author=self.user)
+            response = self.client.get(
+                url, HTTP_IF_MODIFIED_SINCE=http_date(now))
+        self.assertContains(response, 'Свежий пост')
+
+    def test_changes_and_viewer_change_etag(self):
+        """ETag меняется вместе с данными и у разных читателей."""
+        url = reverse('posts:post_detail', args=(self.post.pk,))
+        etag = self.client.get(url)['ETag']
+        reader = Client()
+        reader.force_login(self.reader)
+        response = reader.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        Comment.objects.create(post=self.post, author=self.reader,
+                               text='Новый комментарий')
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertContains(response, 'Новый комментарий')
+
+    def test_new_login_changes_etag(self):
+        """После повторного входа страница приходит с новым CSRF-токеном."""
+        self.reader.set_password('secret')
+        self.reader.save()
+        credentials = {'username': 'Reader', 'password': 'secret'}
+        url = reverse('posts:post_detail', args=(self.post.pk,))
+        self.client.post(reverse('users:login'), credentials)
+        etag = self.client.get(url)['ETag']
+        self.client.logout()
+        self.client.post(reverse('users:login'), credentials)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'csrfmiddlewaretoken')
+
+    def test_login_ignores_if_modified_since(self):
+        """После входа If-Modified-Since не отдаёт чужую страницу."""
+        self.backdate()
+        url = reverse('posts:post_detail', args=(self.post.pk,))
+        modified = self.client.get(url)['Last-Modified']
+        self.client.force_login(self.reader)
+        response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=modified)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('Last-Modified', response)
+        self.assertIn('ETag', response)
@@ -0,0 +1,232 @@
+import logging
+from collections import Counter
+
+from django.conf import settings
+from django.db import transaction
+from django.utils.cache import patch_vary_headers
+from PIL import features
+from sorl.thumbnail import default, get_thumbnail
+from sorl.thumbnail.conf import defaults as sorl_defaults
+from sorl.thumbnail.conf import settings as sorl_settings
+from sorl.thumbnail.images import ImageFile, deserialize_image_file
+from sorl.thumbnail.kvstores.base import add_prefix
+from sorl.thumbnail.kvstores.cached_db_kvstore import EMPTY_VALUE
+from sorl.thumbnail.kvstores.cached_db_kvstore import KVStore as CachedDBStore
+from sorl.thumbnail.models import KVStore
+
+from . import background, caching
+from .models import Post
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_VARIANT = 'card'
+WEBP = ':webp'
+
+_pool = background.Pool('POST_THUMBNAIL_WORKERS', 'thumbnails')
+# Счётчики пакетных поисков миниатюр в этом процессе.
+stats = Counter()
+
+
+def _options(source, geometry, options):
+    # Повторяет сборку опций из ThumbnailBackend.get_thumbnail, чтобы
+    # имя миниатюры совпадало с тем, что создаёт sorl.
+    backend = default.backend
+    options = dict(options)
+    if sorl_settings.THUMBNAIL_PRESERVE_FORMAT:
+        options.setdefault('format', backend._get_format(source))
+    for key, value in backend.default_options.items():
+        options.setdefault(key, value)
+    for key, attr in backend.extra_options:
+        value = getattr(sorl_settings, attr)
+        if value != getattr(sorl_defaults, attr):
+            options.setdefault(key, value)
+    return options
+
+
+def thumbnail_file(image, geometry, options):
+    """Миниатюра картинки без обращения к хранилищу и Pillow."""
+    source = ImageFile(image)
+    name = default.backend._get_thumbnail_filename(
+        source, geometry, _options(source, geometry, options))
+    return ImageFile(name, default.storage)
+
+
+def thumbnail_specs():
+    """Все создаваемые варианты миниатюр.
+
+    К каждому варианту из POST_THUMBNAILS добавляется WebP-копия
+    ``<вариант>:webp``, если она включена и Pillow умеет кодировать WebP.
+    """
+    specs = dict(settings.POST_THUMBNAILS)
+    if settings.POST_THUMBNAIL_WEBP and features.check('webp'):
+        for variant, (geometry, options) in settings.POST_THUMBNAILS.items():
+            specs[variant + WEBP] = (geometry, dict(options, format='WEBP'))
+    return specs
+
+
+def ready_thumbnail(image, variant):
+    """Готовая миниатюра варианта или None, если её ещё не создали."""
+    if not image:
+        return None
+    geometry, options = thumbnail_specs()[variant]
+    return default.kvstore.get(thumbnail_file(image, geometry, options))
+
+
+def _get_raw_many(keys):
+    kvstore = default.kvstore
+    if not isinstance(kvstore, CachedDBStore):
+        values = {key: kvstore._get_raw(key) for key in keys}
+        return {key: value for key, value in values.items() if value}
+    values = kvstore.cache.get_many(keys)
+    stats['cache_hits'] += len(values)
+    missing = [key for key in keys if key not in values]
+    if missing:
+        stats['db_queries'] += 1
+        found = dict(KVStore.objects.filter(
+            key__in=missing).values_list('key', 'value'))
+        # Отсутствие миниатюры тоже кешируется, как в самом sorl.
+        kvstore.cache.set_many(
+            {key: found.get(key, EMPTY_VALUE) for key in missing},
+            sorl_settings.THUMBNAIL_CACHE_TIMEOUT,
+        )
+        values.update(found)
+    return {key: value for key, value in values.items()
+            if value != EMPTY_VALUE}
+
+
+def prefetch(posts):
+    """Находит готовые миниатюры всех постов страницы разом.
+
+    Вместо обращения к хранилищу sorl на каждую карточку делается один
+    get_many к кешу и не больше одного запроса к базе на промахи.
+    Результат кладётся в post.ready_thumbnails.
+    """
+    specs = thumbnail_specs()
+    wanted = {}
+    for post in posts:
+        post.ready_thumbnails = dict.fromkeys(specs)
+        if not post.image:
+            continue
+        for variant, (geometry, options) in specs.items():
+            key = add_prefix(thumbnail_file(post.image, geometry, options).key)
+            wanted.setdefault(key, []).append((post, variant))
+    if not wanted:
+        return
+    stats['batches'] += 1
+    stats['lookups'] += len(wanted)
+    for key, value in _get_raw_many(list(wanted)).items():
+        thumbnail = deserialize_image_file(value)
+        for post, variant in wanted[key]:
+            post.ready_thumbnails[variant] = thumbnail
+    logger.debug('Миниатюры страницы: %s', dict(stats))
+
+
+def tag_savings(response, posts):
+    """Запоминает в ответе, сколько байт картинок страницы экономит WebP.
+
+    Экономия по основному варианту карточки считается при создании
+    миниатюр и хранится в Post.image_webp_savings. Заголовок из неё
+    ставит report_savings() уже после кеша страниц.
+    """
+    response.webp_savings = sum(
+        post.image_webp_savings for post in posts if post.image)
+    return response
+
+
+def report_savings(request, response):
+    """Сообщает экономию WebP тем, кто его принимает.
+
+    Вызывается для каждого ответа, в том числе взятого из кеша, поэтому
+    и заголовок, и статистика зависят от Accept этого запроса.
+    """
+    saved = getattr(response, 'webp_savings', None)
+    if saved is None:
+        return response
+    patch_vary_headers(response, ('Accept',))
+    if 'image/webp' in request.META.get('HTTP_ACCEPT', ''):
+        stats['webp_bytes_saved'] += saved
+        response['X-WebP-Bytes-Saved'] = str(saved)
+    return response
+
+
+def generate(post_id):
+    """Создаёт все варианты миниатюр поста и сбрасывает кеш его лент."""
+    post = Post.objects.filter(pk=post_id).only(
+        'image', 'author_id', 'group_id').first()
+    if post is None or not post.image:
+        return
+    made = {
+        variant: get_thumbnail(post.image, geometry, **options)
+        for variant, (geometry, options) in thumbnail_specs().items()
+    }
+    webp = made.get(DEFAULT_VARIANT + WEBP)
+    if webp is not None:
+        jpeg = made[DEFAULT_VARIANT]
+        Post.objects.filter(pk=post.pk).update(
+            image_webp_savings=jpeg.storage.size(jpeg.name)
+            - webp.storage.size(webp.name))
+    # В кеше лент карточка пока ссылается на оригинал картинки.
+    caching.bump(*caching.post_scopes(post.pk, post.author_id, post.group_id))
+
+
+def render(name):
+    """Заново рисует все варианты миниатюр картинки поверх старых.
+
+    Исходник декодируется один раз на все варианты. Функция не ходит
+    в базу и годится для пула процессов: размеры исходника и миниатюр
+    возвращаются, а записывает их в хранилище sorl функция store().
+    Для каждого варианта отдаются имя, размеры и вес файла в байтах.
+    """
+    source = ImageFile(name, Post._meta.get_field('image').storage)
+    engine = default.engine
+    source_image = engine.get_image(source)
+    try:
+        image_info = engine.get_image_info(source_image)
+        made = {}
+        for variant, (geometry, options) in thumbnail_specs().items():
+            thumbnail = thumbnail_file(source, geometry, options)
+            # image_info нужен кодировщику, но не входит в имя миниатюры.
+            options = dict(_options(source, geometry, options),
+                           image_info=image_info)
+            default.backend._create_thumbnail(
+                source_image, geometry, options, thumbnail)
+            made[variant] = (thumbnail.name, thumbnail.size,
+                             default.storage.size(thumbnail.name))
+        return engine.get_image_size(source_image), made
+    finally:
+        engine.cleanup(source_image)
+
+
+def store(name, source_size, made):
+    """Записывает в хранилище sorl результат render()."""
+    source = ImageFile(name, Post._meta.get_field('image').storage)
+    source.set_size(source_size)
+    default.kvstore.get_or_set(source)
+    for thumbnail_name, size, _ in made.values():
+        thumbnail = ImageFile(thumbnail_name, default.storage)
+        thumbnail.set_size(size)
+        default.kvstore.set(thumbnail, source)
+
+
+def webp_savings(made):
+    """Экономия WebP по основному варианту из результата render().
+
+    Без WebP-копии экономии нет, и прежнее значение тоже обнуляется.
+    """
+    webp = made.get(DEFAULT_VARIANT + WEBP)
+    if webp is None:
+        return 0
+    return made[DEFAULT_VARIANT][2] - webp[2]
+
+
+def _run(post_id):
+    try:
+        generate(post_id)
+    except Exception:
+        logger.exception('Не удалось создать миниатюры поста %s', post_id)
+
+
+def enqueue(post):
+    """Ставит создание миниатюр в очередь после коммита транзакции."""
+    if post.image:
+        transaction.on_commit(lambda: _pool.submit(_run, post.pk))
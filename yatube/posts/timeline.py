@@ -0,0 +1,75 @@
+from collections import defaultdict
+
+from django.conf import settings
+from django.db.models import F
+
+from .models import Follow, Post, TimelineEntry
+
+TIMELINE_KEYS = ('timeline_date', 'timeline_post')
+
+
+def _insert(entries):
+    TimelineEntry.objects.bulk_create(
+        entries, batch_size=settings.TIMELINE_BATCH_SIZE,
+        ignore_conflicts=True)
+
+
+def fan_out(post):
+    """Кладёт новый пост в ленты всех подписчиков автора."""
+    followers = Follow.objects.filter(
+        author_id=post.author_id).values_list('user_id', flat=True)
+    entries = []
+    for user_id in followers.iterator():
+        entries.append(TimelineEntry(
+            user_id=user_id, post_id=post.pk, pub_date=post.pub_date))
+        if len(entries) == settings.TIMELINE_BATCH_SIZE:
+            _insert(entries)
+            entries = []
+    _insert(entries)
+
+
+def fan_out_many(posts):
+    """Раскладывает пачку новых постов по лентам подписчиков авторов."""
+    by_author = defaultdict(list)
+    for post in posts:
+        by_author[post.author_id].append(post)
+    followers = Follow.objects.filter(
+        author_id__in=by_author).values_list('author_id', 'user_id')
+    entries = []
+    for author_id, user_id in followers.iterator():
+        for post in by_author[author_id]:
+            entries.append(TimelineEntry(
+                user_id=user_id, post_id=post.pk, pub_date=post.pub_date))
+        if len(entries) >= settings.TIMELINE_BATCH_SIZE:
+            _insert(entries)
+            entries = []
+    _insert(entries)
+
+
+def backfill(user_id, author_id):
+    """Заполняет ленту подписчика постами автора после подписки."""
+    posts = Post.objects.filter(
+        author_id=author_id).values_list('pk', 'pub_date')
+    entries = []
+    for post_id, pub_date in posts.iterator():
+        entries.append(TimelineEntry(
+            user_id=user_id, post_id=post_id, pub_date=pub_date))
+        if len(entries) == settings.TIMELINE_BATCH_SIZE:
+            _insert(entries)
+            entries = []
+    _insert(entries)
+
+
+def prune(user_id, author_id):
+    """Убирает посты автора из ленты после отписки."""
+    TimelineEntry.objects.filter(
+        user_id=user_id, post__author_id=author_id).delete()
+
+
+def feed(user):
+    """Посты ленты подписок с ключами сортировки из таблицы ленты."""
+    posts = Post.objects.feed().filter(timeline_entries__user=user)
+    return posts.annotate(
+        timeline_date=F('timeline_entries__pub_date'),
+        timeline_post=F('timeline_entries__post_id'),
+    )
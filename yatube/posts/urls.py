@@ -13,6 +13,8 @@ urlpatterns = [
          name='group_list'),
     path('profile/<str:username>/', views.profile,
          name='profile'),
+    path('search/', views.search_posts,
+         name='search'),
     path('posts/<int:post_id>/', views.post_detail,
          name='post_detail'),
     path('create/', views.post_create,
@@ -34,7 +36,11 @@ urlpatterns = [
     path('profile/<str:username>/unfollow/', views.profile_unfollow,
          name='profile_unfollow'),
     path('posts/<int:post_id>/delete/', views.post_delete,
-         name='post_delete')
+         name='post_delete'),
+    path('export/<str:table>/', views.export_table,
+         name='export'),
+    path('archive/', views.data_archive,
+         name='data_archive'),
 ]
 
 if settings.DEBUG:
@@ -1,10 +1,160 @@
+import base64
+import binascii
+import datetime
+import json
+
+from django.core.exceptions import ValidationError
 from django.core.paginator import Paginator
 from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import Dislikes, Likes
+
+FEED_KEYS = ('pub_date', 'id')
+
+
+def encode_cursor(values):
+    raw = json.dumps([
+        value.isoformat() if hasattr(value, 'isoformat') else value
+        for value in values
+    ], separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def _cursor_value(field, value):
+    value = field.to_python(value)
+    if value is None:
+        raise ValidationError('Пустое значение курсора')
+    if isinstance(value, datetime.datetime) and timezone.is_naive(value):
+        value = timezone.make_aware(value)
+    return value
+
+
+def decode_cursor(token, fields):
+    """Значения курсора, приведённые к типам полей ключа, или None.
+
+    Курсор приходит от клиента, поэтому подделанный токен тоже считается
+    испорченным и открывает первую страницу.
+    """
+    if not token:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        values = json.loads(raw.decode())
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        return None
+    if not isinstance(values, list) or len(values) != len(fields):
+        return None
+    try:
+        return [_cursor_value(field, value)
+                for field, value in zip(fields, values)]
+    except (ValidationError, TypeError, ValueError):
+        return None
+
+
+class CursorPaginator(Paginator):
+    """Постраничный вывод по ключу сортировки, без COUNT и OFFSET.
+
+    Лента сортируется по убыванию ``keys``; страница выбирается условием
+    «строго после/до курсора», поэтому стоимость запроса не зависит от
+    глубины страницы.
+    """
+
+    def __init__(self, object_list, per_page, keys=FEED_KEYS):
+        self.keys = keys
+        super().__init__(self.order(object_list), per_page)
+        self.cursor = ''
+        self.has_next = False
+        self.has_previous = False
+        self.next_cursor = None
+        self.previous_cursor = None
+
+    def order(self, object_list):
+        return object_list.order_by(*('-' + key for key in self.keys))
+
+    def seek(self, values, reverse=False):
+        lookup = 'gt' if reverse else 'lt'
+        condition = Q()
+        for position, key in enumerate(self.keys):
+            step = Q(**{f'{key}__{lookup}': values[position]})
+            for previous, value in zip(self.keys[:position], values):
+                step &= Q(**{previous: value})
+            condition |= step
+        return condition
+
+    def fetch(self, values, reverse):
+        object_list = self.object_list
+        if values is not None:
+            object_list = object_list.filter(self.seek(values, reverse))
+        if reverse:
+            object_list = object_list.reverse()
+        return list(object_list[:self.per_page + 1])
+
+    def cursor_values(self, obj):
+        return [getattr(obj, key) for key in self.keys]
+
+    def cursor_field(self, key):
+        """Поле модели или аннотации, по типу которого читается ключ."""
+        query = self.object_list.query
+        if key in query.annotations:
+            return query.annotations[key].output_field
+        meta = self.object_list.model._meta
+        return meta.pk if key == 'pk' else meta.get_field(key)
+
+    def cursor_page(self, after=None, before=None):
+        fields = [self.cursor_field(key) for key in self.keys]
+        values = decode_cursor(before, fields)
+        reverse = values is not None
+        if reverse:
+            self.cursor = 'before:' + before
+        else:
+            values = decode_cursor(after, fields)
+            if values is not None:
+                self.cursor = 'after:' + after
+        object_list = self.fetch(values, reverse)
+        more = len(object_list) > self.per_page
+        object_list = object_list[:self.per_page]
+        if reverse:
+            object_list.reverse()
+            self.has_previous, self.has_next = more, True
+        else:
+            self.has_previous, self.has_next = values is not None, more
+        if object_list and self.has_previous:
+            self.previous_cursor = encode_cursor(
+                self.cursor_values(object_list[0]))
+        if object_list and self.has_next:
+            self.next_cursor = encode_cursor(
+                self.cursor_values(object_list[-1]))
+        number = 2 if self.has_previous else 1
+        self.num_pages = number + 1 if self.has_next else number
+        return self._get_page(object_list, number, self)
+
+
+def attach_reactions(posts, user):
+    """Отмечает посты, которые пользователь уже лайкнул или дизлайкнул."""
+    liked = disliked = set()
+    if user.is_authenticated and posts:
+        ids = [post.pk for post in posts]
+        liked = set(Likes.objects.filter(
+            user=user, post_id__in=ids).values_list('post_id', flat=True))
+        disliked = set(Dislikes.objects.filter(
+            user=user, post_id__in=ids).values_list('post_id', flat=True))
+    for post in posts:
+        post.viewer_liked = post.pk in liked
+        post.viewer_disliked = post.pk in disliked
+
 
+def paginate(request, post_list, keys=FEED_KEYS):
+    paginator = CursorPaginator(
+        post_list, settings.NUMBER_POSTS_ON_FIRST_PAGE, keys)
+    return paginator.cursor_page(
+        after=request.GET.get('after'),
+        before=request.GET.get('before'),
+    )
 
-def get_page(request, post_list,):
 
-    paginator = Paginator(post_list, settings.NUMBER_POSTS_ON_FIRST_PAGE)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+def get_page(request, post_list, keys=FEED_KEYS):
+    page_obj = paginate(request, post_list, keys)
+    attach_reactions(page_obj.object_list, request.user)
     return page_obj
@@ -1,37 +1,64 @@
+from django.conf import settings
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth.decorators import login_required
 from django.shortcuts import get_object_or_404, redirect, render
-from django.http import HttpResponseRedirect
+from django.http import (FileResponse, Http404, HttpResponseBadRequest,
+                         HttpResponseRedirect, StreamingHttpResponse)
+from django.db import transaction
+from django.db.models import F
+from django.db.models.functions import Greatest
 
+from . import archive, caching, export, search, thumbnails, timeline
 from .models import Comment, Dislikes, Follow, Group, Likes, Post, User
 from .forms import GroupForm, CommentForm, PostForm
-from .utils import get_page
+from .utils import attach_reactions, get_page, paginate
 
 
 def index(request):
-    post_list = Post.objects.all()
+    version = caching.generation(caching.INDEX)
+    response = caching.not_modified(request, version)
+    if response is not None:
+        return response
+    post_list = Post.objects.feed()
+    page_obj = get_page(request, post_list)
 
     context = {
-        'page_obj': get_page(request, post_list),
+        'page_obj': page_obj,
+        'feed_cache': caching.feed_cache(request, page_obj, version),
     }
-    return render(request, 'posts/index.html', context)
+    response = render(request, 'posts/index.html', context)
+    thumbnails.tag_savings(response, page_obj)
+    return caching.tag_response(response, version, page_obj, request)
 
 
 def group_posts(request, slug_name):
     group = get_object_or_404(Group, slug=slug_name)
     template = 'posts/group_list.html'
-    post_list = group.posts.all()
+    version = caching.generation(caching.group_scope(group.pk))
+    response = caching.not_modified(request, version)
+    if response is not None:
+        return response
+    post_list = Post.objects.feed().filter(group=group)
+    page_obj = get_page(request, post_list)
 
     context = {
-        'page_obj': get_page(request, post_list),
+        'page_obj': page_obj,
+        'feed_cache': caching.feed_cache(request, page_obj, version),
         'group': group,
     }
-    return render(request, template, context)
+    response = render(request, template, context)
+    thumbnails.tag_savings(response, page_obj)
+    return caching.tag_response(response, version, page_obj, request)
 
 
 def profile(request, username):
     author = get_object_or_404(User, username=username)
-    posts = Post.objects.select_related('group',
-                                        ).filter(author__username=username)
+    version = caching.generation(caching.author_scope(author.pk))
+    response = caching.not_modified(request, version)
+    if response is not None:
+        return response
+    posts = Post.objects.feed().filter(author=author)
+    page_obj = get_page(request, posts)
     following = False
     if (request.user != author
             and request.user.is_authenticated
@@ -40,15 +67,41 @@ def profile(request, username):
 
         following = True
     context = {
-        'page_obj': get_page(request, posts),
+        'page_obj': page_obj,
+        'feed_cache': caching.feed_cache(request, page_obj, version),
         'author': author,
         'following': following
     }
-    return render(request, 'posts/profile.html', context)
+    response = render(request, 'posts/profile.html', context)
+    thumbnails.tag_savings(response, page_obj)
+    return caching.tag_response(response, version, page_obj, request)
+
+
+def search_posts(request):
+    query = request.GET.get('q', '').strip()
+    page_obj = None
+    if query:
+        paginator = search.SearchPaginator(
+            query, settings.NUMBER_POSTS_ON_FIRST_PAGE)
+        page_obj = paginator.cursor_page(
+            after=request.GET.get('after'),
+            before=request.GET.get('before'),
+        )
+        attach_reactions(page_obj.object_list, request.user)
+    context = {
+        'query': query,
+        'page_obj': page_obj,
+    }
+    return render(request, 'posts/search.html', context)
 
 
 def post_detail(request, post_id):
     post = get_object_or_404(Post, pk=post_id)
+    version = caching.generation(
+        caching.post_scope(post.pk), caching.author_scope(post.author_id))
+    response = caching.not_modified(request, version)
+    if response is not None:
+        return response
 
     comments = Comment.objects.select_related('author').filter(post=post)
     form = CommentForm()
@@ -57,7 +110,8 @@ def post_detail(request, post_id):
         'form': form,
         'comments': comments,
     }
-    return render(request, 'posts/post_detail.html', context)
+    response = render(request, 'posts/post_detail.html', context)
+    return caching.tag_response(response, version, request=request)
 
 
 @login_required
@@ -76,6 +130,7 @@ def post_create(request):
     post = form.save(commit=False)
     post.author = request.user
     post.save()
+    thumbnails.enqueue(post)
     return redirect('posts:profile', post.author.username)
 
 
@@ -91,6 +146,8 @@ def post_edit(request, post_id):
         )
         if form.is_valid():
             form.save()
+            if 'image' in form.changed_data:
+                thumbnails.enqueue(post)
             return redirect('posts:post_detail', post_id=post_id)
         context = {'form': form, 'is_edit': is_edit, 'post_id': post_id}
         return render(request, 'posts/create_post.html', context)
@@ -105,16 +162,38 @@ def add_comment(request, post_id):
         comment = form.save(commit=False)
         comment.author = request.user
         comment.post = post
-        comment.save()
+        with transaction.atomic():
+            comment.save()
+            Post.objects.filter(pk=post.pk).update(
+                comments_count=F('comments_count') + 1)
     return redirect('posts:post_detail', post_id=post_id)
 
 
 @login_required
 def follow_index(request):
-    posts = Post.objects.select_related(
-        'author').filter(author__following__user=request.user)
-    context = {'page_obj': get_page(request, posts)}
-    return render(request, 'posts/follow.html', context)
+    posts = timeline.feed(request.user)
+    # Лента подписок меняется вместе с постами авторов на странице, а
+    # авторы известны только после запроса. Поколения должны быть
+    # прочитаны до запроса, поэтому страница перечитывается, пока все её
+    # авторы не окажутся среди уже прочитанных.
+    authors = set()
+    while True:
+        version = caching.generation(
+            caching.follow_scope(request.user.pk),
+            *map(caching.author_scope, sorted(authors)))
+        page_obj = paginate(request, posts, timeline.TIMELINE_KEYS)
+        page_authors = {post.author_id for post in page_obj}
+        if page_authors <= authors:
+            break
+        authors |= page_authors
+    attach_reactions(page_obj.object_list, request.user)
+    context = {
+        'page_obj': page_obj,
+        'feed_cache': caching.feed_cache(request, page_obj, version),
+    }
+    response = render(request, 'posts/follow.html', context)
+    thumbnails.tag_savings(response, page_obj)
+    return response
 
 
 @login_required
@@ -155,14 +234,71 @@ def post_delete(request, post_id):
 @login_required
 def add_like(request, post_id):
     post = get_object_or_404(Post, pk=post_id)
-    Likes.objects.get_or_create(user=request.user, post=post)
-    Dislikes.objects.filter(user=request.user, post=post).delete()
+    with transaction.atomic():
+        created = Likes.objects.get_or_create(
+            user=request.user, post=post)[1]
+        removed = Dislikes.objects.filter(
+            user=request.user, post=post).delete()[0]
+        Post.objects.filter(pk=post.pk).update(
+            likes_count=F('likes_count') + int(created),
+            dislikes_count=Greatest(F('dislikes_count') - removed, 0))
     return HttpResponseRedirect(request.META.get('HTTP_REFERER'))
 
 
 @login_required
 def add_dislike(request, post_id):
     post = get_object_or_404(Post, pk=post_id)
-    Dislikes.objects.get_or_create(user=request.user, post=post)
-    Likes.objects.filter(user=request.user, post=post).delete()
+    with transaction.atomic():
+        created = Dislikes.objects.get_or_create(
+            user=request.user, post=post)[1]
+        removed = Likes.objects.filter(
+            user=request.user, post=post).delete()[0]
+        Post.objects.filter(pk=post.pk).update(
+            dislikes_count=F('dislikes_count') + int(created),
+            likes_count=Greatest(F('likes_count') - removed, 0))
     return HttpResponseRedirect(request.META.get('HTTP_REFERER'))
+
+
+@staff_member_required
+def export_table(request, table):
+    if table not in export.TABLES:
+        raise Http404
+    file_format = request.GET.get('format', 'jsonl')
+    if file_format not in export.FORMATS:
+        return HttpResponseBadRequest('Неизвестный формат')
+    since = since_id = None
+    try:
+        if request.GET.get('since'):
+            since = export.parse_since(request.GET['since'])
+        if request.GET.get('since_id'):
+            since_id = int(request.GET['since_id'])
+    except ValueError:
+        return HttpResponseBadRequest('Неверный водяной знак')
+    compress = bool(request.GET.get('gzip'))
+    filename = f'{table}.{file_format}'
+    content_type = export.FORMATS[file_format]
+    if compress:
+        filename += '.gz'
+        content_type = 'application/gzip'
+    response = StreamingHttpResponse(
+        export.export(table, file_format, since, since_id, compress),
+        content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+
+@login_required
+def data_archive(request):
+    user = request.user
+    filename = archive.filename(user)
+    ready = archive.ready(user.pk)
+    if ready is not None:
+        return FileResponse(open(ready, 'rb'), as_attachment=True,
+                            filename=filename)
+    if archive.is_large(user):
+        archive.enqueue(user)
+        return render(request, 'posts/archive_pending.html')
+    response = StreamingHttpResponse(
+        archive.stream(user), content_type='application/zip')
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
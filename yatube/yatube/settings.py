@@ -46,11 +46,14 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    # Отвечает 304 и на страницы из AnonymousPageCacheMiddleware.
+    'django.middleware.http.ConditionalGetMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
+    'posts.middleware.AnonymousPageCacheMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
@@ -134,11 +137,19 @@ EMAIL_BACKEND = 'django.core.mail.backends.filebased.EmailBackend'
 # указываем директорию, в которую будут складываться файлы писем
 EMAIL_FILE_PATH = os.path.join(BASE_DIR, 'sent_emails')
 
+# общий для всех процессов кеш в файле SQLite
 CACHES = {
     'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'BACKEND': 'core.cache_backends.sqlite.SQLiteCache',
+        'LOCATION': os.path.join(BASE_DIR, 'cache.sqlite3'),
+        'OPTIONS': {
+            'MAX_ENTRIES': 100000,
+            'MAX_SIZE': 256 * 1024 * 1024,
+        },
     }
 }
+# Тесты получают кеш во временном каталоге, см. core.test_runner.
+TEST_RUNNER = 'core.test_runner.IsolatedCacheRunner'
 
 WORDS_OUTPUT_LIMIT = 15
 TEST_NUM = 1
@@ -149,7 +160,54 @@ NUMBER_POSTS_ON_SECOND_PAGE = 5
 ONE_POST = 1
 CACHE_SAVE_TIME = 20
 NOTING_IN_FOLLOW_INDEX = 0
+TIMELINE_BATCH_SIZE = 1000
+COUNTERS_BATCH_SIZE = 1000
+IMAGES_BATCH_SIZE = 1000
+IMPORT_BATCH_SIZE = 1000
+EXPORT_CHUNK_SIZE = 2000
+# Архивы «скачать мои данные»: большие собираются в фоне и лежат вне
+# MEDIA_ROOT, чтобы их нельзя было скачать без входа.
+ARCHIVE_ROOT = os.path.join(BASE_DIR, 'archives')
+ARCHIVE_INLINE_MAX_ITEMS = 1000
+ARCHIVE_INLINE_MAX_BYTES = 50 * 1024 * 1024
+ARCHIVE_MAX_AGE = 60 * 60 * 24
+ARCHIVE_BUILD_TIMEOUT = 60 * 60
+ARCHIVE_WORKERS = 1
+FEED_CACHE_TIMEOUT = 60 * 60 * 24
+ANONYMOUS_CACHE_TIMEOUT = 60 * 60
+ANONYMOUS_CACHE_MAX_AGE = 60
 
 CSRF_FAILURE_VIEW = 'core.views.csrf_failure'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+
+# варианты миниатюр картинок постов: геометрия и опции sorl-thumbnail
+POST_THUMBNAILS = {
+    'card': ('960x339', {'crop': 'center', 'upscale': True}),
+    'card_480': ('480x170', {'crop': 'center', 'upscale': True}),
+}
+# создавать ли к миниатюрам WebP-копии (если Pillow собран с WebP)
+POST_THUMBNAIL_WEBP = True
+# миниатюры перезаписываются атомарно, см. manage.py regenerate_thumbnails
+THUMBNAIL_STORAGE = 'posts.storage.OverwriteStorage'
+# из каких вариантов собирается srcset картинки
+POST_THUMBNAIL_SRCSET = {
+    'card': ('card_480', 'card'),
+}
+# картинки постов хранятся не больше этого размера по большей стороне
+POST_IMAGE_MAX_SIDE = 1920
+POST_IMAGE_MAX_PIXELS = 50 * 1000 * 1000
+POST_IMAGE_QUALITY = 85
+# на сколько битов dHash могут отличаться похожие картинки (не больше 3)
+POST_IMAGE_DUPLICATE_DISTANCE = 3
+# раскладка файлов картинок по каталогам: posts.layouts.HashLayout
+# или posts.layouts.DateLayout; после смены — manage.py layout_post_images
+POST_IMAGE_LAYOUT = 'posts.layouts.HashLayout'
+POST_IMAGE_LAYOUT_DEPTH = 2
+# сколько секунд сохранённый файл картинки ждёт коммита своего поста,
+# прежде чем сборщик сможет удалить его без ссылок
+POST_IMAGE_CLAIM_TIMEOUT = 10 * 60
+# загрузки крупнее этого пишутся во временный файл, а не в память
+FILE_UPLOAD_MAX_MEMORY_SIZE = 1024 * 1024
+# 0 — создавать миниатюры сразу после коммита, без фонового пула
+POST_THUMBNAIL_WORKERS = 2